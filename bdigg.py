@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from constants import (
+    BDIGG_ADDRESS,
+    BDIGG_PPFS_PATH,
+    DIGG_ADDRESS,
+    DIGG_DECIMALS,
+    ZERO_ADDRESS,
+)
+from rpc_batch import RpcBatch, RpcBatchError
+from thread_pool import map_threaded
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+# getPricePerFullShare() selector on the bDIGG sett
+GET_PRICE_PER_FULL_SHARE = "0x77c7b8fc"
+PPFS_SCALE = 10 ** 18
+PPFS_FETCH_ATTEMPTS = 3
+
+
+def is_revert(error: RpcBatchError) -> bool:
+    return "revert" in str(error.error).lower()
+
+
+class BDiggShareIndex:
+    def __init__(self, api, path: str = BDIGG_PPFS_PATH):
+        """
+        bDIGG price per full share by block, the digg base units one bDIGG base unit
+        is worth scaled by PPFS_SCALE. Missing blocks are fetched in one batch of
+        eth_calls and every fetched block is cached on disk, since historic share
+        prices never change.
+
+        prices: dict(block: ppfs), None for blocks before the sett existed
+
+        Fetches are serialized, the server crawls new addresses while the watcher
+        updates.
+        """
+        self.api = api
+        self.path = path
+        self.prices = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for block_number, price in json.load(f).items():
+                    self.prices[int(block_number)] = price
+
+    def prefetch(self, block_numbers):
+        with self._lock:
+            self._prefetch(block_numbers)
+
+    def _prefetch(self, block_numbers):
+        missing = sorted(
+            set(int(block_number) for block_number in block_numbers) - set(self.prices)
+        )
+        if not missing:
+            return
+
+        fetched = len(missing)
+        errors = []
+        for attempt in range(PPFS_FETCH_ATTEMPTS):
+            if attempt:
+                time.sleep(attempt)
+            batch = RpcBatch(self.api.web3)
+            call = {"to": BDIGG_ADDRESS, "data": GET_PRICE_PER_FULL_SHARE}
+            for block_number in missing:
+                batch.add("eth_call", [call, hex(block_number)])
+
+            errors = []
+            for block_number, result in zip(missing, batch.execute()):
+                if isinstance(result, RpcBatchError) and not is_revert(result):
+                    # rate limits, timeouts and node errors say nothing about the
+                    # share price, so they're retried and never cached
+                    errors.append((block_number, result))
+                elif isinstance(result, RpcBatchError) or result in (None, "0x"):
+                    # calls before the sett was deployed revert or return nothing
+                    self.prices[block_number] = None
+                else:
+                    self.prices[block_number] = int(result, 16)
+
+            missing = [block_number for block_number, _ in errors]
+            if not missing:
+                break
+
+        self._save()
+        if errors:
+            block_number, error = errors[0]
+            raise RpcBatchError(
+                error.method,
+                f"{len(errors)} bDIGG share prices failed, block {block_number}: "
+                f"{error.error}",
+            )
+
+        logger.info(f"Fetched bDIGG price per share at {fetched} blocks")
+
+    def price_per_share(self, block_number: int) -> int:
+        block_number = int(block_number)
+        if block_number not in self.prices:
+            self.prefetch([block_number])
+
+        return self.prices[block_number]
+
+    def to_digg_tx(self, tx: dict) -> dict:
+        """
+        Returns a copy of an etherscan bDIGG transfer with its value in digg, or None
+        if the share price is unknown at its block.
+        """
+        price = self.price_per_share(tx["blockNumber"])
+        if price == None:
+            return None
+
+        digg_tx = dict(tx)
+        digg_tx["value"] = str(int(tx["value"]) * price // PPFS_SCALE)
+        digg_tx["tokenDecimal"] = str(DIGG_DECIMALS)
+        digg_tx["bdigg_value"] = tx["value"]
+
+        return digg_tx
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.prices, f)
+        os.replace(tmp_path, self.path)
+
+
+def get_addresses_exposure_txs(
+    api, index: BDiggShareIndex, start_block: int, addresses: list
+) -> dict:
+    """
+    Returns each address's digg transfers merged with its bDIGG transfers converted
+    to digg, sorted by block. Both tokens come from one etherscan request per
+    address and the share prices for every address from one batch.
+
+    Deposits show up as digg sent to the sett and bDIGG of the same value minted in
+    the same tx, withdrawals the other way round. Both legs are flagged as
+    vault_transfer so Position moves the lots across instead of booking a sell and
+    a buy.
+
+    return: dict(address: list(tx))
+    """
+    token_txs = map_threaded(
+        lambda address: api.get_address_erc20_txs_by_token(
+            start_block, address, [DIGG_ADDRESS, BDIGG_ADDRESS]
+        ),
+        addresses,
+    )
+    index.prefetch(tx["blockNumber"] for txs in token_txs for tx in txs[BDIGG_ADDRESS])
+
+    exposure_txs = {}
+    for address, txs in zip(addresses, token_txs):
+        mark_vault_transfers(txs[DIGG_ADDRESS], txs[BDIGG_ADDRESS])
+        bdigg_txs = [index.to_digg_tx(tx) for tx in txs[BDIGG_ADDRESS]]
+        exposure_txs[address] = sorted(
+            txs[DIGG_ADDRESS] + [tx for tx in bdigg_txs if tx != None],
+            key=lambda tx: int(tx["blockNumber"]),
+        )
+
+    return exposure_txs
+
+
+def mark_vault_transfers(digg_txs: list, bdigg_txs: list):
+    """
+    Flags the digg and bDIGG legs of each deposit into and withdrawal from the sett
+    with vault_transfer: digg sent to or from the sett in the same tx as bDIGG is
+    minted or burned.
+    """
+    share_hashes = set(
+        tx["hash"] for tx in bdigg_txs if ZERO_ADDRESS in (tx["from"], tx["to"])
+    )
+    vault_hashes = set()
+    for tx in digg_txs:
+        if tx["hash"] in share_hashes and BDIGG_ADDRESS in (tx["from"], tx["to"]):
+            tx["vault_transfer"] = True
+            vault_hashes.add(tx["hash"])
+    for tx in bdigg_txs:
+        if tx["hash"] in vault_hashes and ZERO_ADDRESS in (tx["from"], tx["to"]):
+            tx["vault_transfer"] = True
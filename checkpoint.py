@@ -0,0 +1,88 @@
+from decimal import Decimal
+import json
+import logging
+import os
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+
+class MarketCapCheckpoint:
+    def __init__(self, path: str):
+        """
+        Append-only record of historic market cap samples, one json line per sampled
+        block:
+
+        {"block": 11671543, "entry": ["1610402313", "1234.5", "0.04"]}
+
+        Blocks sampled before the digg wbtc pool existed are stored with a null entry
+        so they aren't sampled again.
+        """
+        self.path = path
+
+    def load(self) -> list:
+        """
+        return: list(tuple(block_number, entry)) in the order they were sampled
+        """
+        samples = []
+        if not os.path.exists(self.path):
+            return samples
+
+        with open(self.path, "rb+") as f:
+            good_offset = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("missing newline")
+                    sample = json.loads(line)
+                except ValueError:
+                    # a crash mid-write can leave a partial last line, drop it so the
+                    # next append starts on a clean line
+                    logger.warning(f"Truncating partial checkpoint line in {self.path}")
+                    f.truncate(good_offset)
+                    break
+                good_offset += len(line)
+                entry = sample["entry"]
+                if entry:
+                    entry = [entry[0], Decimal(entry[1]), Decimal(entry[2])]
+                samples.append((sample["block"], entry))
+
+        return samples
+
+    def resume(self, block_number: int, stride: int) -> tuple:
+        """
+        Returns the stored entries on the grid of every stride blocks from block_number
+        and the first block on that grid that hasn't been sampled yet.
+
+        return: tuple(list(entry), next_block)
+        """
+        entries = []
+        next_block = block_number
+        for sample_block, entry in self.load():
+            if sample_block != next_block:
+                continue
+            if entry:
+                entries.append(entry)
+            next_block += stride
+
+        return entries, next_block
+
+    def append(self, block_number: int, entry: list):
+        self.extend([(block_number, entry)])
+
+    def extend(self, samples: list):
+        """
+        samples: list(tuple(block_number, entry)), written with a single fsync
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        lines = [
+            json.dumps({"block": block_number, "entry": entry}, default=str) + "\n"
+            for block_number, entry in samples
+        ]
+        with open(self.path, "a") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from constants import ETHERSCAN_RATE_LIMIT
+
+
+class ClientRegistry:
+    def __init__(self):
+        """
+        Process wide clients, created once on first use and shared by every DiggApi.
+        Clients that aren't safe to share between threads, like requests.Session,
+        are registered per_thread and every thread gets its own.
+        """
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._local = threading.local()
+
+    def get(self, name: str, factory, per_thread: bool = False):
+        if per_thread:
+            client = getattr(self._local, name, None)
+            if client == None:
+                client = factory()
+                setattr(self._local, name, client)
+            return client
+
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = factory()
+            return self._clients[name]
+
+
+class RateLimiter:
+    def __init__(self, calls_per_second: float):
+        """
+        Spaces calls at least 1 / calls_per_second seconds apart across every thread
+        sharing the limiter.
+        """
+        self.interval = 1 / calls_per_second
+        self._lock = threading.Lock()
+        self._next_call = 0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimitedClient:
+    def __init__(self, client, limiter: RateLimiter):
+        """
+        Wraps client so every method call first waits its turn on limiter.
+        """
+        self._client = client
+        self._limiter = limiter
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self._limiter.acquire()
+            return attr(*args, **kwargs)
+
+        return call
+
+
+clients = ClientRegistry()
+# etherscan limits calls per second per api key, which every thread shares
+etherscan_limiter = RateLimiter(ETHERSCAN_RATE_LIMIT)
@@ -15,8 +15,64 @@ WBTC_ADDRESS = "0x2260fac5e5542a773aa44fbcfedf7c193bc2c599"
 WBTC_DECIMALS = 8
 WBTC_DIGG_PAIR_ID = "0xe86204c4eddd2f70ee00ead6805f917671f56c52"
 WBTC_USDC_PAIR_ID = "0x004375dff511095cc5a197a54140a24efef3a416"
+# mints and burns are transfers from and to the zero address
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
 ETHERSCAN_API_KEY = os.getenv("ETHERSCAN_API_KEY")
 ETH_BLOCKS_PER_DAY = 6500
 TEST_ADDRESS = "0xB1AdceddB2941033a090dD166a462fe1c2029484"
 UNISWAP_SUBGRAPH = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v2"
 DIGG_IT_INFURA_URL = os.getenv("DIGG_IT_INFURA_URL")
+WATCH_POLL_INTERVAL = int(os.getenv("DIGG_IT_WATCH_POLL_INTERVAL", 60))
+SERVER_HOST = os.getenv("DIGG_IT_SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("DIGG_IT_SERVER_PORT", 8080))
+# addresses the server keeps watching and response bodies it keeps cached
+SERVER_MAX_POSITIONS = int(os.getenv("DIGG_IT_SERVER_MAX_POSITIONS", 256))
+SERVER_MAX_RESPONSES = int(os.getenv("DIGG_IT_SERVER_MAX_RESPONSES", 1024))
+# most market cap points a single /market-cap?resolution= query may sample
+SERVER_MAX_RESOLUTION = int(os.getenv("DIGG_IT_SERVER_MAX_RESOLUTION", 2000))
+DIGG_IT_DATA_DIR = os.getenv("DIGG_IT_DATA_DIR", "data")
+MARKET_CAP_CHECKPOINT_PATH = os.path.join(DIGG_IT_DATA_DIR, "market_cap.jsonl")
+SUPPLY_TABLE_PATH = os.path.join(DIGG_IT_DATA_DIR, "supply_table.bin")
+PRICE_BLOCK_TOLERANCE = int(os.getenv("DIGG_IT_PRICE_BLOCK_TOLERANCE", 0))
+# comma separated json rpc endpoints, DIGG_IT_INFURA_URL is used when unset
+DIGG_IT_RPC_URLS = [
+    url for url in os.getenv("DIGG_IT_RPC_URLS", "").split(",") if url
+] or [DIGG_IT_INFURA_URL]
+RPC_HEDGE_MIN_SAMPLES = int(os.getenv("DIGG_IT_RPC_HEDGE_MIN_SAMPLES", 20))
+RPC_PROVIDER_MAX_ERRORS = int(os.getenv("DIGG_IT_RPC_PROVIDER_MAX_ERRORS", 3))
+RPC_PROVIDER_COOLDOWN = int(os.getenv("DIGG_IT_RPC_PROVIDER_COOLDOWN", 30))
+RPC_BATCH_SIZE = int(os.getenv("DIGG_IT_RPC_BATCH_SIZE", 100))
+RPC_LOG_RANGE = int(os.getenv("DIGG_IT_RPC_LOG_RANGE", ETH_BLOCKS_PER_DAY * 30))
+TRANSFER_INDEX_PATH = os.path.join(DIGG_IT_DATA_DIR, "transfers.npz")
+COST_BASIS_METHOD = os.getenv("DIGG_IT_COST_BASIS_METHOD", "fifo")
+THREAD_POOL_SIZE = int(os.getenv("DIGG_IT_THREADS", 8))
+# calls per second allowed by the etherscan api key's plan
+ETHERSCAN_RATE_LIMIT = float(os.getenv("DIGG_IT_ETHERSCAN_RATE_LIMIT", 5))
+# relative market cap change between neighbouring samples worth sampling between
+MARKET_CAP_CHANGE_THRESHOLD = float(
+    os.getenv("DIGG_IT_MARKET_CAP_CHANGE_THRESHOLD", 0.02)
+)
+MARKET_CAP_MIN_BLOCK_GAP = int(os.getenv("DIGG_IT_MARKET_CAP_MIN_BLOCK_GAP", 100))
+WARM_START_PATH = os.path.join(DIGG_IT_DATA_DIR, "warm_start.json.gz")
+BDIGG_PPFS_PATH = os.path.join(DIGG_IT_DATA_DIR, "bdigg_ppfs.json")
+PERF_DIR = os.getenv("DIGG_IT_PERF_DIR", "perf")
+PERF_FIXTURES_DIR = os.path.join(PERF_DIR, "fixtures")
+PERF_BASELINE_PATH = os.path.join(PERF_DIR, "baseline.json")
+# name=address pairs perf_report measures, lp is a holder with thousands of transfers.
+# A name without an address, like small, gets a holder with a handful of transfers
+# picked when its fixture is recorded.
+PERF_WALLETS = dict(
+    wallet.split("=", 1)
+    for wallet in os.getenv(
+        "DIGG_IT_PERF_WALLETS", f"small=,test={TEST_ADDRESS},lp={WBTC_DIGG_PAIR_ID}"
+    ).split(",")
+    if wallet
+)
+PERF_REPEAT = int(os.getenv("DIGG_IT_PERF_REPEAT", 3))
+# allowed relative growth over the baseline before a metric counts as a regression
+PERF_TIME_THRESHOLD = float(os.getenv("DIGG_IT_PERF_TIME_THRESHOLD", 0.25))
+PERF_MEMORY_THRESHOLD = float(os.getenv("DIGG_IT_PERF_MEMORY_THRESHOLD", 0.2))
+PERF_REQUEST_THRESHOLD = float(os.getenv("DIGG_IT_PERF_REQUEST_THRESHOLD", 0))
+# growth below these is noise whatever the relative change
+PERF_TIME_MIN_DELTA = float(os.getenv("DIGG_IT_PERF_TIME_MIN_DELTA", 0.05))
+PERF_MEMORY_MIN_DELTA = int(os.getenv("DIGG_IT_PERF_MEMORY_MIN_DELTA", 1 << 20))
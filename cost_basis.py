@@ -0,0 +1,93 @@
+from collections import deque
+from decimal import Decimal
+
+from constants import COST_BASIS_METHOD, DIGG_INITIAL_SUPPLY
+
+COST_BASIS_METHODS = ("fifo", "lifo", "average")
+
+
+class CostBasis:
+    def __init__(self, method: str = COST_BASIS_METHOD):
+        """
+        Matches sells against bought lots to split P&L into realized and unrealized.
+
+        method: fifo sells the oldest lots first, lifo the newest, average keeps a
+            single lot at the average cost
+        lots: deque of [shares, usdc_cost, wbtc_cost]. Amounts are in shares,
+            market_cap_pct * DIGG_INITIAL_SUPPLY, so rebases don't change a lot.
+
+        Every lot is added and removed once, so each buy and sell is amortized O(1).
+        """
+        if method not in COST_BASIS_METHODS:
+            raise ValueError(f"Unknown cost basis method: {method}")
+
+        self.method = method
+        self.lots = deque()
+        self.shares = Decimal(0)
+        self.usdc_cost = Decimal(0)
+        self.wbtc_cost = Decimal(0)
+        self.realized_usdc = Decimal(0)
+        self.realized_wbtc = Decimal(0)
+
+    def buy(self, shares: Decimal, usdc_cost: Decimal, wbtc_cost: Decimal):
+        if self.method == "average" and self.lots:
+            lot = self.lots[0]
+            lot[0] += shares
+            lot[1] += usdc_cost
+            lot[2] += wbtc_cost
+        else:
+            self.lots.append([shares, usdc_cost, wbtc_cost])
+
+        self.shares += shares
+        self.usdc_cost += usdc_cost
+        self.wbtc_cost += wbtc_cost
+
+    def sell(self, shares: Decimal, usdc_proceeds: Decimal, wbtc_proceeds: Decimal):
+        """
+        Shares sold beyond the lots held, e.g. received before tracking started, have
+        no cost so their whole proceeds are realized.
+        """
+        matched_usdc = Decimal(0)
+        matched_wbtc = Decimal(0)
+        remaining = shares
+
+        while remaining > 0 and self.lots:
+            lot = self.lots[-1] if self.method == "lifo" else self.lots[0]
+            if lot[0] <= remaining:
+                if self.method == "lifo":
+                    self.lots.pop()
+                else:
+                    self.lots.popleft()
+                remaining -= lot[0]
+                matched_usdc += lot[1]
+                matched_wbtc += lot[2]
+                self.shares -= lot[0]
+                continue
+
+            fraction = remaining / lot[0]
+            usdc_cost = lot[1] * fraction
+            wbtc_cost = lot[2] * fraction
+            lot[0] -= remaining
+            lot[1] -= usdc_cost
+            lot[2] -= wbtc_cost
+            matched_usdc += usdc_cost
+            matched_wbtc += wbtc_cost
+            self.shares -= remaining
+            remaining = Decimal(0)
+
+        self.usdc_cost -= matched_usdc
+        self.wbtc_cost -= matched_wbtc
+        self.realized_usdc += usdc_proceeds - matched_usdc
+        self.realized_wbtc += wbtc_proceeds - matched_wbtc
+
+    def unrealized(self, market_cap: list) -> dict:
+        """
+        market_cap: list(timestamp, digg_usdc_mcap, digg_wbtc_mcap) to value the held
+            lots at
+        """
+        market_cap_pct = self.shares / DIGG_INITIAL_SUPPLY
+
+        return {
+            "unrealized_usdc": market_cap_pct * market_cap[1] - self.usdc_cost,
+            "unrealized_wbtc": market_cap_pct * market_cap[2] - self.wbtc_cost,
+        }
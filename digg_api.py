@@ -2,11 +2,14 @@ from bs4 import BeautifulSoup as soup
 from datetime import datetime
 from decimal import Decimal
 from etherscan import Etherscan
+from functools import lru_cache
 import logging
 import os
 import requests
 import time
+from eth_utils import event_abi_to_log_topic
 from web3 import Web3
+from web3._utils.method_formatters import receipt_formatter
 
 from constants import (
     REBASE_DELTA_ADDRESS,
@@ -26,51 +29,97 @@ from constants import (
     ETH_BLOCKS_PER_DAY,
     UNISWAP_SUBGRAPH,
     TEST_ADDRESS,
-    DIGG_IT_INFURA_URL,
+    DIGG_IT_RPC_URLS,
+    MARKET_CAP_CHECKPOINT_PATH,
+    RPC_LOG_RANGE,
+    THREAD_POOL_SIZE,
+    MARKET_CAP_CHANGE_THRESHOLD,
 )
 
 from abi import DIGG_CONTRACT_ABI, REBASE_DELTA_ABI
+from checkpoint import MarketCapCheckpoint
+from clients import RateLimitedClient, clients, etherscan_limiter
+from provider_pool import ProviderPool
+from rpc_batch import RpcBatch, RpcBatchError
+from series import adaptive_sample
+from supply_table import load_supply_table, rebase_timestamp
+from thread_pool import map_threaded
+from warm_start import load_warm_start
 
 logger = logging.getLogger("digg-it")
 logger.setLevel(logging.DEBUG)
 
-UNISWAP_POOL_QUERY = """
-    query($pairId: String!, $blockNumber: Int) {
-        pair(
-            block: { number: $blockNumber }
-            id: $pairId
-        ) {
-            id
-            liquidityProviderCount
-            reserveUSD
-            token0 {
-                name
-            }
-            token0Price
-            token1 {
-                name
-            }
-            token1Price
-            volumeToken0
-            volumeToken1
-            volumeUSD
+# etherscan answers a query with nothing in range with an error status and this
+# message, which etherscan-python raises as an AssertionError
+NO_TRANSACTIONS_FOUND = "No transactions found"
+
+
+@lru_cache(maxsize=None)
+def build_pair_query(pairs: tuple) -> str:
+    """
+    Builds a subgraph query for several pairs at one block that only selects the
+    fields each caller reads.
+
+    pairs: tuple(tuple(alias, tuple(field))), each alias takes its pair id from the
+        $<alias>Id variable
+
+    build_pair_query((("pair", ("token0Price",)),)) ->
+        query($blockNumber: Int, $pairId: String!) {
+            pair: pair(block: { number: $blockNumber }, id: $pairId) { token0Price }
         }
-    }
     """
-cache = {}
+    variables = "".join(f", ${alias}Id: String!" for alias, _ in pairs)
+    selections = "".join(
+        f"""
+        {alias}: pair(block: {{ number: $blockNumber }}, id: ${alias}Id) {{
+            {" ".join(fields)}
+        }}"""
+        for alias, fields in pairs
+    )
+
+    return f"""
+    query($blockNumber: Int{variables}) {{{selections}
+    }}
+    """
 
 
 class DiggApi:
     def __init__(self):
-        if cache.get("session") == None:
-            cache["session"] = requests.Session()
-        if cache.get("web3") == None:
-            cache["web3"] == Web3(Web3.HTTPProvider(DIGG_IT_INFURA_URL))
-        self.session = cache.get("session")
-        self.web3 = cache.get("web3")
-        self.eth = Etherscan(ETHERSCAN_API_KEY)
+        self.web3 = clients.get("web3", lambda: Web3(ProviderPool(DIGG_IT_RPC_URLS)))
+        # historic block data never changes, so it is kept for the life of the api
+        self.timestamp_cache = {}
+        self.price_cache = {}
+        # blocks a PricePlanner priced at the snapped block before them, dict(block:
+        # snapped block). Kept apart from price_cache so only exact prices are reused
+        # across runs.
+        self.snapped_blocks = {}
         self.latest_block = self.get_latest_block()
-        self.rebases = self.get_rebases()
+        # a synced supply table is shared read only between processes and saves
+        # every api instance from scraping and parsing the rebase history, rebases
+        # only holds the ones past its tip
+        self.supply_table = load_supply_table()
+        self.rebases = []
+        # sync_rebases fetches the rebases after rebases_block, None scrapes them all
+        # from digg.finance
+        self.rebases_block = None
+        # a warm start snapshot preloads the caches and rebases
+        warm_start_block = load_warm_start(self)
+        if warm_start_block != None:
+            self.rebases_block = warm_start_block
+        elif self.supply_table != None:
+            self.rebases_block = max(self.supply_table.tip_block, DIGG_START_BLOCK)
+
+    @property
+    def session(self) -> requests.Session:
+        return clients.get("session", requests.Session, per_thread=True)
+
+    @property
+    def eth(self) -> Etherscan:
+        return clients.get(
+            "etherscan",
+            lambda: RateLimitedClient(Etherscan(ETHERSCAN_API_KEY), etherscan_limiter),
+            per_thread=True,
+        )
 
     def get_latest_block(self) -> int:
         return int(
@@ -94,37 +143,173 @@ class DiggApi:
 
         return rebases
 
-    def get_rebases_web3(self) -> list:
+    def sync_rebases(self):
+        """
+        Brings rebases up to latest_block. Only the rebases past the warm start or
+        supply table are fetched, and the ones with a block are added to the supply
+        table in memory so block lookups don't stop at its tip. Without either the
+        rebases are scraped.
+
+        Nothing is fetched when the api is created, so it's ready to use without a
+        round trip. Sync before looking up supplies past the table or warm start.
+        """
+        if self.rebases_block == None:
+            self.add_rebases(self.get_rebases())
+            return
+        if self.rebases_block >= self.latest_block:
+            return
+
+        new_rebases = self.add_rebases(self.get_rebases_web3(self.rebases_block + 1))
+        if new_rebases:
+            logger.info(
+                f"Synced {len(new_rebases)} rebases since block {self.rebases_block}"
+            )
+        self.rebases_block = self.latest_block
+        if self.supply_table != None:
+            self.supply_table = self.supply_table.extend(self.rebases)
+
+    def add_rebases(self, rebases: list) -> list:
+        """
+        Adds the rebases that are neither in rebases nor the supply table to the
+        front of rebases and returns them.
+
+        rebases: newest first, like get_rebases
+        """
+        known = set(rebase["tx"] for rebase in self.rebases)
+        new_rebases = [
+            rebase
+            for rebase in rebases
+            if rebase["tx"] not in known
+            and (
+                self.supply_table == None
+                or self.supply_table.block_of(rebase["tx"]) == None
+            )
+        ]
+        self.rebases = new_rebases + self.rebases
+
+        return new_rebases
+
+    def get_rebases_web3(self, from_block: int = DIGG_START_BLOCK) -> list:
+        """
+        Returns the rebases since from_block in the same newest first format as
+        get_rebases, with their block_number. The log ranges, receipts and blocks are
+        each fetched with batched json rpc calls.
+        """
         # Use the supply delta contract because it has fewer transactions and is quicker to query
         # to get the full list of rebases. Could use the digg contract but it requires getting
         # more transactions because people trade with it.
         rebase_contract_address = self.web3.toChecksumAddress(REBASE_DELTA_ADDRESS)
-        rebase_contract = self.web3.eth.contract(
-            address=rebase_contract_address, abi=REBASE_DELTA_ABI
+        rebase_event_abi = [
+            abi
+            for abi in REBASE_DELTA_ABI
+            if abi.get("type") == "event" and abi.get("name") == "LogRebase"
+        ][0]
+        rebase_topic = "0x" + event_abi_to_log_topic(rebase_event_abi).hex()
+        # the new total supply is logged by the digg contract in the same tx
+        digg_contract = self.web3.eth.contract(
+            address=self.web3.toChecksumAddress(DIGG_ADDRESS), abi=DIGG_CONTRACT_ABI
         )
 
         # get list of transactions that emit a LogRebase event
-        rebase_txs = (
-            rebase_contract.events.LogRebase()
-            .createFilter(fromBlock=DIGG_START_BLOCK)
-            .get_all_entries()
-        )
-        rebases = []
+        log_filter = {"address": rebase_contract_address, "topics": [rebase_topic]}
+        rebase_logs = self.get_logs_batched(log_filter, from_block, self.latest_block)
+        tx_hashes = list(dict.fromkeys(log["transactionHash"] for log in rebase_logs))
 
-        for tx in rebase_txs:
-            rebase = {}
+        batch = RpcBatch(self.web3)
+        for tx_hash in tx_hashes:
+            batch.add("eth_getTransactionReceipt", [tx_hash])
+        receipts = batch.execute()
 
-            tx_hash = tx["transactionHash"].hex()
-            receipt = self.web3.eth.getTransactionReceipt(tx_hash)
-            tx_log = rebase_contract.events.LogRebase().processReceipt(receipt)
+        rebases = []
+        for tx_hash, receipt in zip(tx_hashes, receipts):
+            if isinstance(receipt, RpcBatchError):
+                raise receipt
+            tx_log = digg_contract.events.LogRebase().processReceipt(
+                receipt_formatter(receipt)
+            )
 
+            rebase = {}
             rebase["tx"] = tx_hash
             rebase["block_number"] = tx_log[0]["blockNumber"]
-            rebase["supply"] = tx_log[0]["args"]["totalSupply"] / DIGG_DECIMALS
+            rebase["supply"] = str(
+                Decimal(tx_log[0]["args"]["totalSupply"]) / 10 ** DIGG_DECIMALS
+            )
             rebases.append(rebase)
 
+        timestamps = self.get_block_timestamps(
+            [rebase["block_number"] for rebase in rebases]
+        )
+        for rebase in rebases:
+            rebase["time"] = datetime.utcfromtimestamp(
+                int(timestamps[rebase["block_number"]])
+            ).strftime("%Y-%m-%d %H:%M:%S")
+        rebases.reverse()
+
         return rebases
 
+    def get_logs_batched(
+        self, log_filter: dict, from_block: int, to_block: int
+    ) -> list:
+        """
+        Splits eth_getLogs over from_block to to_block into RPC_LOG_RANGE sized ranges
+        sent as one batch. Ranges the node refuses, usually for returning too many
+        logs, are halved and sent again.
+        """
+        ranges = [
+            (start, min(start + RPC_LOG_RANGE - 1, to_block))
+            for start in range(from_block, to_block + 1, RPC_LOG_RANGE)
+        ]
+        logs = []
+        while ranges:
+            batch = RpcBatch(self.web3)
+            for start, end in ranges:
+                batch.add(
+                    "eth_getLogs",
+                    [dict(log_filter, fromBlock=hex(start), toBlock=hex(end))],
+                )
+
+            failed = []
+            for (start, end), result in zip(ranges, batch.execute()):
+                if not isinstance(result, RpcBatchError):
+                    logs.extend(result)
+                elif start == end:
+                    raise result
+                else:
+                    middle = (start + end) // 2
+                    failed.extend([(start, middle), (middle + 1, end)])
+            ranges = failed
+
+        logs.sort(
+            key=lambda log: (int(log["blockNumber"], 16), int(log["logIndex"], 16))
+        )
+
+        return logs
+
+    def get_block_timestamps(self, block_numbers: list) -> dict:
+        """
+        Batched get_block_timestamp for many blocks at once.
+
+        return: dict(block_number: timestamp)
+        """
+        missing = [
+            block_number
+            for block_number in set(block_numbers)
+            if block_number not in self.timestamp_cache
+        ]
+
+        batch = RpcBatch(self.web3)
+        for block_number in missing:
+            batch.add("eth_getBlockByNumber", [hex(block_number), False])
+        for block_number, block in zip(missing, batch.execute()):
+            if isinstance(block, RpcBatchError):
+                raise block
+            self.timestamp_cache[block_number] = str(int(block["timestamp"], 16))
+
+        return {
+            block_number: self.timestamp_cache[block_number]
+            for block_number in block_numbers
+        }
+
     def get_digg_current_supply(self):
         return Decimal(
             self.session.get(
@@ -133,32 +318,43 @@ class DiggApi:
             / DIGG_DECIMALS
         )
 
-    def get_historic_market_cap_since_block(self, block_number: int) -> list:
+    def get_historic_market_cap_since_block(
+        self, block_number: int, checkpoint_path: str = MARKET_CAP_CHECKPOINT_PATH
+    ) -> list:
         """
         Returns list of market cap every ETH_BLOCKS_PER_DAY / 2 (twice a day) since block_number.
 
+        Samples are appended to the checkpoint at checkpoint_path a chunk at a time as
+        they are taken, so a later call only samples blocks past the stored tip. Pass None to keep the
+        samples in memory only.
+
         return: list(list(timestamp, totx_digg_usdc_mcap, totx_digg_wbtc_mcap))
         """
         historic_market_cap = []
+        stride = int(ETH_BLOCKS_PER_DAY / 2)
+        checkpoint = MarketCapCheckpoint(checkpoint_path) if checkpoint_path else None
 
         logger.info(f"Getting historic market cap since: block {block_number}")
 
-        while block_number < self.latest_block:
-            entry = []
-            timestamp = self.eth.get_block_reward_by_block_number(
-                block_no=block_number
-            )["timeStamp"]
-            supply = self.get_digg_supply(timestamp, self.rebases)
-            wbtc_price = self.get_digg_wbtc_price_at_block(block_number)
+        if checkpoint:
+            historic_market_cap, next_block = checkpoint.resume(block_number, stride)
+            if next_block > block_number:
+                logger.info(f"Resuming historic market cap from block {next_block}")
+            block_number = next_block
+
+        sample_blocks = list(range(block_number, self.latest_block, stride))
+        chunk_size = THREAD_POOL_SIZE * 4
+        for start in range(0, len(sample_blocks), chunk_size):
+            # sample a chunk in parallel, then checkpoint it in block order with a
+            # single fsync
+            chunk = sample_blocks[start : start + chunk_size]
+            entries = map_threaded(self.get_market_cap_sample, chunk)
+            if checkpoint:
+                checkpoint.extend(list(zip(chunk, entries)))
             # The digg wbtc pool didn't exist until a few thousand blocks after the
-            # digg contract was created. Only append entries for blocks with the pool.
-            if wbtc_price:
-                usdc_price = self.get_wbtc_usdc_price_at_block(block_number)
-                entry.append(timestamp)
-                entry.append(supply * usdc_price)
-                entry.append(supply * wbtc_price)
-                historic_market_cap.append(entry)
-            block_number += int(ETH_BLOCKS_PER_DAY / 2)
+            # digg contract was created. Only append entries for blocks with the
+            # pool.
+            historic_market_cap.extend(entry for entry in entries if entry)
 
         logger.info(
             f"Grabbed historic market cap for {len(historic_market_cap)} entries"
@@ -167,6 +363,139 @@ class DiggApi:
 
         return historic_market_cap
 
+    def get_market_cap_series(
+        self,
+        resolution: int,
+        start_timestamp: int = None,
+        end_timestamp: int = None,
+        threshold: float = MARKET_CAP_CHANGE_THRESHOLD,
+    ) -> list:
+        """
+        Returns about resolution market cap entries between the timestamps, sampled
+        densely only around rebases and where the market cap moved by more than
+        threshold between neighbouring samples or by rebases between them. Defaults
+        to the whole history.
+
+        return: list(list(timestamp, totx_digg_usdc_mcap, totx_digg_wbtc_mcap))
+        """
+        start_block = DIGG_START_BLOCK
+        end_block = self.latest_block
+        if start_timestamp != None:
+            start_block = max(self.get_block_by_timestamp(start_timestamp), start_block)
+        if end_timestamp != None:
+            end_block = min(self.get_block_by_timestamp(end_timestamp), end_block)
+
+        rebase_changes = self.get_rebase_changes(start_block, end_block)
+        samples = adaptive_sample(
+            self.get_market_cap_sample,
+            start_block,
+            end_block,
+            resolution,
+            threshold,
+            rebase_changes,
+        )
+        logger.info(
+            f"Sampled {len(samples)} market cap entries from block {start_block} "
+            f"to {end_block}"
+        )
+
+        return [entry for _, entry in samples]
+
+    def get_rebase_changes(self, start_block: int, end_block: int) -> dict:
+        """
+        Returns the relative supply change of each rebase after start_block up to
+        end_block, which the market cap jumps by at its block. The supply table's
+        are read from its records. Scraped rebases past it don't carry their block,
+        the ones in range are looked up by their timestamp and kept on the rebase.
+
+        return: dict(block_number: change)
+        """
+        changes = {}
+        previous_supply = DIGG_INITIAL_SUPPLY
+        rebases = list(reversed(self.rebases))
+        if self.supply_table != None:
+            changes.update(self.supply_table.supply_changes(start_block, end_block))
+            previous_supply = self.supply_table.tip_supply
+            rebases = [
+                rebase
+                for rebase in rebases
+                if self.supply_table.block_of(rebase["tx"]) == None
+            ]
+
+        timestamps = self.get_block_timestamps([start_block, end_block])
+        start_timestamp = int(timestamps[start_block])
+        end_timestamp = int(timestamps[end_block])
+        unresolved = [
+            rebase
+            for rebase in rebases
+            if "block_number" not in rebase
+            and start_timestamp < rebase_timestamp(rebase) <= end_timestamp
+        ]
+        blocks = map_threaded(
+            lambda rebase: self.get_block_by_timestamp(rebase_timestamp(rebase)),
+            unresolved,
+        )
+        for rebase, block_number in zip(unresolved, blocks):
+            rebase["block_number"] = block_number
+
+        for rebase in rebases:
+            supply = float(rebase["supply"])
+            if start_block < rebase.get("block_number", 0) <= end_block:
+                changes[rebase["block_number"]] = supply / previous_supply - 1
+            previous_supply = supply
+
+        return changes
+
+    def get_block_by_timestamp(self, timestamp: int) -> int:
+        return int(
+            self.eth.get_block_number_by_timestamp(
+                timestamp=int(timestamp), closest="before"
+            )
+        )
+
+    def get_market_cap_sample_blocks(
+        self, block_number: int, checkpoint_path: str = MARKET_CAP_CHECKPOINT_PATH
+    ) -> list:
+        """
+        Returns the blocks get_historic_market_cap_since_block still has to sample.
+        """
+        stride = int(ETH_BLOCKS_PER_DAY / 2)
+        if checkpoint_path:
+            _, block_number = MarketCapCheckpoint(checkpoint_path).resume(
+                block_number, stride
+            )
+
+        return list(range(block_number, self.latest_block, stride))
+
+    def get_market_cap_sample(self, block_number: int) -> list:
+        """
+        Returns the market cap at block_number, or None if the digg wbtc pool didn't
+        exist yet.
+
+        return: list(timestamp, totx_digg_usdc_mcap, totx_digg_wbtc_mcap)
+        """
+        price = self.get_digg_price_at_block(block_number)
+        if price["digg_wbtc_price"] == None:
+            return None
+
+        timestamp = self.get_block_timestamp(block_number)
+        supply = self.get_digg_supply(timestamp, self.rebases)
+
+        return [
+            timestamp,
+            supply * price["digg_usdc_price"],
+            supply * price["digg_wbtc_price"],
+        ]
+
+    def get_block_timestamp(self, block_number: int) -> str:
+        if block_number not in self.timestamp_cache:
+            block_reward = self.eth.get_block_reward_by_block_number(
+                block_no=block_number
+            )
+            self.timestamp_cache[block_number] = block_reward["timeStamp"]
+
+        return self.timestamp_cache[block_number]
+
     def get_digg_supply(self, tx_timestamp: str, rebases: list) -> Decimal:
         """
         {
@@ -176,6 +505,14 @@ class DiggApi:
             'change': '-1.90%'
         }
         """
+        # the table can't know about rebases after its tip, those are looked up in
+        # rebases first
+        if (
+            self.supply_table != None
+            and int(tx_timestamp) < self.supply_table.tip_timestamp
+        ):
+            return self.supply_table.supply_at_timestamp(tx_timestamp)
+
         tx_datetime = datetime.utcfromtimestamp(int(tx_timestamp))
 
         for rebase in rebases:
@@ -183,61 +520,131 @@ class DiggApi:
             if tx_datetime >= rebase_datetime:
                 return Decimal(rebase["supply"])
 
+        if self.supply_table != None:
+            return self.supply_table.supply_at_timestamp(tx_timestamp)
+
         return Decimal(DIGG_INITIAL_SUPPLY)
 
     def get_digg_wbtc_price_at_block(self, block_number: int) -> Decimal:
+        pair = self.query_pairs_at_block(
+            block_number, {"pair": (WBTC_DIGG_PAIR_ID, ("token0Price",))}
+        )["pair"]
 
-        variables = {"pairId": WBTC_DIGG_PAIR_ID, "blockNumber": block_number}
+        logger.info(f"digg_wbtc_price: {pair}")
 
-        request = self.session.post(
-            UNISWAP_SUBGRAPH, json={"query": UNISWAP_POOL_QUERY, "variables": variables}
-        )
+        return None if pair == None else Decimal(pair["token0Price"])
 
-        logger.info(f"digg_wbtc_price: {request.json()}")
+    def get_wbtc_usdc_price_at_block(self, block_number: int) -> Decimal:
+        pair = self.query_pairs_at_block(
+            block_number, {"pair": (WBTC_USDC_PAIR_ID, ("token1Price",))}
+        )["pair"]
 
-        return (
-            None
-            if request.json()["data"]["pair"] == None
-            else Decimal(request.json()["data"]["pair"]["token0Price"])
-        )
+        return Decimal(pair["token1Price"])
 
-    def get_wbtc_usdc_price_at_block(self, block_number: int) -> Decimal:
+    def query_pairs_at_block(self, block_number: int, pairs: dict) -> dict:
+        """
+        Queries several uniswap pairs at block_number in one subgraph request,
+        decoding the response once.
 
-        variables = {"pairId": WBTC_USDC_PAIR_ID, "blockNumber": block_number}
+        pairs: dict(alias: tuple(pair_id, tuple(field)))
+
+        return: dict(alias: dict(field: value)), None for pairs that didn't exist yet
+        """
+        query = build_pair_query(
+            tuple((alias, fields) for alias, (_, fields) in pairs.items())
+        )
+        variables = {f"{alias}Id": pair_id for alias, (pair_id, _) in pairs.items()}
+        variables["blockNumber"] = block_number
 
         request = self.session.post(
-            UNISWAP_SUBGRAPH, json={"query": UNISWAP_POOL_QUERY, "variables": variables}
+            UNISWAP_SUBGRAPH, json={"query": query, "variables": variables}
         )
 
-        return Decimal(request.json()["data"]["pair"]["token1Price"])
+        return request.json()["data"]
 
     def get_address_erc20_token_txs(
         self, start_block: int, user_address: str, token_address: str
     ) -> list:
+        return self.get_address_erc20_txs_by_token(
+            start_block, user_address, [token_address]
+        )[token_address]
+
+    def get_address_erc20_txs_by_token(
+        self, start_block: int, user_address: str, token_addresses: list
+    ) -> dict:
+        """
+        Splits the address's erc20 transfers by token, so several tokens cost one
+        etherscan request. An address without transfers since start_block gets empty
+        lists.
+
+        return: dict(token_address: list(tx))
+        """
 
         latest_block = self.latest_block
 
-        all_txs = self.eth.get_erc20_token_transfer_events_by_address(
-            address=user_address,
-            startblock=start_block,
-            endblock=latest_block,
-            sort="asc",
-        )
+        try:
+            all_txs = self.eth.get_erc20_token_transfer_events_by_address(
+                address=user_address,
+                startblock=start_block,
+                endblock=latest_block,
+                sort="asc",
+            )
+        except AssertionError as e:
+            if NO_TRANSACTIONS_FOUND not in str(e):
+                raise
+            all_txs = []
 
-        token_txs = []
+        token_txs = {token_address: [] for token_address in token_addresses}
         for tx in all_txs:
-            if tx["contractAddress"] == token_address:
-                token_txs.append(tx)
+            if tx["contractAddress"] in token_txs:
+                token_txs[tx["contractAddress"]].append(tx)
 
         return token_txs
 
+    def get_addresses_erc20_token_txs(
+        self, start_block: int, user_addresses: list, token_address: str
+    ) -> dict:
+        """
+        get_address_erc20_token_txs for several addresses, fetched in parallel.
+
+        return: dict(address: list(tx))
+        """
+        all_token_txs = map_threaded(
+            lambda address: self.get_address_erc20_token_txs(
+                start_block, address, token_address
+            ),
+            user_addresses,
+        )
+
+        return dict(zip(user_addresses, all_token_txs))
+
     def get_digg_price_at_block(self, block_number: int) -> dict:
+        block_number = self.snapped_blocks.get(block_number, block_number)
+        if block_number not in self.price_cache:
+            self.price_cache[block_number] = self._get_digg_price_at_block(block_number)
+
+        return self.price_cache[block_number]
+
+    def _get_digg_price_at_block(self, block_number: int) -> dict:
         price = {}
 
-        # TODO: speed these calls up, right now taking too long. About 3 txs per second able to be processed
-        wbtc_in_usdc = self.get_wbtc_usdc_price_at_block(block_number)
+        # both pairs in one request, selecting only the price each one is read for
+        pairs = self.query_pairs_at_block(
+            block_number,
+            {
+                "digg_wbtc": (WBTC_DIGG_PAIR_ID, ("token0Price",)),
+                "wbtc_usdc": (WBTC_USDC_PAIR_ID, ("token1Price",)),
+            },
+        )
+        if pairs["digg_wbtc"] == None:
+            price["digg_wbtc_price"] = None
+            price["digg_usdc_price"] = None
+            price["wbtc_usdc_price"] = None
+            return price
+
+        price["digg_wbtc_price"] = Decimal(pairs["digg_wbtc"]["token0Price"])
+        wbtc_in_usdc = Decimal(pairs["wbtc_usdc"]["token1Price"])
 
-        price["digg_wbtc_price"] = self.get_digg_wbtc_price_at_block(block_number)
         price["digg_usdc_price"] = wbtc_in_usdc * price["digg_wbtc_price"]
         price["wbtc_usdc_price"] = wbtc_in_usdc
 
@@ -1,4 +1,5 @@
 from bs4 import BeautifulSoup as soup
+from contextlib import nullcontext
 from datetime import datetime
 from decimal import Decimal
 from etherscan import Etherscan
@@ -30,7 +31,61 @@ logger.setLevel(logging.DEBUG)
 # coingecko: digg, badger-sett-digg
 
 from transaction import Transaction
+from bdigg import BDiggShareIndex, get_addresses_exposure_txs
 from digg_api import DiggApi
+from position import Position, format_transaction
+from pricing import PricePlanner
+
+
+def run(api: DiggApi, address: str, phase=nullcontext) -> Position:
+    """
+    Runs the full pipeline for address: rebases, transfers, prices, the position's
+    trading profit and the historic market cap.
+
+    phase: function(name) -> context manager entered around each stage, which
+        perf_report uses to measure them
+    """
+    with phase("rebases"):
+        # only the rebases past the warm start or supply table are fetched
+        logger.info("Syncing rebases")
+        api.sync_rebases()
+
+    with phase("transactions"):
+        logger.info("Getting transactions")
+        bdigg_index = BDiggShareIndex(api)
+        digg_txs = get_addresses_exposure_txs(
+            api, bdigg_index, DIGG_START_BLOCK, [address]
+        )[address]
+
+    with phase("pricing"):
+        logger.info("Planning prices")
+        planner = PricePlanner(api)
+        planner.add_many(tx["blockNumber"] for tx in digg_txs)
+        planner.add_many(api.get_market_cap_sample_blocks(DIGG_START_BLOCK))
+        planner.fetch()
+
+    with phase("profit"):
+        formatted_txs = []
+
+        logger.info("Formatting transactions")
+        for tx in digg_txs:
+            formatted_txs.append(format_transaction(api, address, tx))
+
+        logger.info("Get trading profit")
+        position = Position(address)
+
+        for tx in formatted_txs:
+            position.apply(tx)
+
+        num_txs = len(formatted_txs)
+        logger.info(f"Txs processed: {num_txs}")
+
+    with phase("market_cap"):
+        logger.info(f"Getting historic market cap")
+        api.get_historic_market_cap_since_block(DIGG_START_BLOCK)
+
+    return position
+
 
 if __name__ == "__main__":
 
@@ -56,54 +111,7 @@ if __name__ == "__main__":
     start = time.time()
     logger.info(f"Started at {start}")
 
-    api = DiggApi()
-
-    logger.info("Getting rebases")
-    rebases = api.get_rebases()
-    logger.info("Getting transactions")
-    digg_txs = api.get_address_erc20_token_txs(
-        DIGG_START_BLOCK, TEST_ADDRESS, DIGG_ADDRESS
-    )
-
-    formatted_txs = []
-
-    logger.info("Formatting transactions")
-    for tx in digg_txs:
-        if tx["to"] == str.lower(TEST_ADDRESS):
-            tx["type"] = "buy"
-        else:
-            tx["type"] = "sell"
-        tx["totx_supply"] = api.get_digg_supply(tx["timeStamp"], rebases)
-        tx["totx_price"] = api.get_digg_price(int(tx["blockNumber"]))
-        formatted_txs.append(Transaction(tx))
-
-    logger.info("Get trading profit")
-    digg_mcap_pct = []
-    digg_usdc_mcap_price = []
-    digg_wbtc_mcap_price = []
-    wbtc_profit = 0
-    usdc_profit = 0
-
-    for tx in formatted_txs:
-        digg_usdc_mcap = tx.totx_digg_supply * tx.totx_digg_price["digg_usdc_price"]
-        digg_wbtc_mcap = tx.totx_digg_supply * tx.totx_digg_price["digg_wbtc_price"]
-        if tx.tx_type == "buy":
-            digg_mcap_pct.append(tx.market_cap_pct)
-            usdc_profit -= tx.market_cap_pct * digg_usdc_mcap
-            wbtc_profit -= tx.market_cap_pct * digg_wbtc_mcap
-        else:
-            digg_mcap_pct.append(-tx.market_cap_pct)
-            usdc_profit += tx.market_cap_pct * digg_usdc_mcap
-            wbtc_profit += tx.market_cap_pct * digg_wbtc_mcap
-
-        digg_usdc_mcap_price.append(digg_usdc_mcap)
-        digg_wbtc_mcap_price.append(digg_wbtc_mcap)
-
-    num_txs = len(formatted_txs)
-    logger.info(f"Txs processed: {num_txs}")
-
-    logger.info(f"Getting historic market cap")
-    api.get_historic_market_cap_since_block(DIGG_START_BLOCK)
+    run(DiggApi(), TEST_ADDRESS)
 
     finish = time.time()
     logger.info(f"Finished at {finish}")
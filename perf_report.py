@@ -0,0 +1,616 @@
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+import gzip
+import hashlib
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+from constants import (
+    BDIGG_ADDRESS,
+    DIGG_ADDRESS,
+    PERF_BASELINE_PATH,
+    PERF_FIXTURES_DIR,
+    PERF_MEMORY_MIN_DELTA,
+    PERF_MEMORY_THRESHOLD,
+    PERF_REPEAT,
+    PERF_REQUEST_THRESHOLD,
+    PERF_TIME_MIN_DELTA,
+    PERF_TIME_THRESHOLD,
+    PERF_WALLETS,
+    WBTC_DIGG_PAIR_ID,
+    ZERO_ADDRESS,
+)
+from digg_api import DiggApi
+from digg_it import run
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+FIXTURE_VERSION = 1
+# json rpc endpoint replayed runs are pointed at, requests never leave the process
+REPLAY_RPC_URL = "http://localhost:8545"
+# served for requests the fixture has no recording of
+MISSING_RESPONSE = {
+    "status": 404,
+    "content_type": "application/json",
+    "body": '{"message": "No recorded response"}',
+}
+# digg receivers perf_report record looks through for a small holder
+SMALL_HOLDER_CANDIDATES = 100
+SMALL_HOLDER_MAX_TXS = 5
+# metric: kind of threshold it's compared with
+METRICS = {
+    "wall_time": "time",
+    "requests": "request",
+    "peak_rss": "memory",
+    "allocated": "memory",
+    "peak_allocated": "memory",
+}
+
+
+class FixtureMissing(Exception):
+    def __init__(self, endpoint: str):
+        super().__init__(f"No recorded response for {endpoint}, re-record the fixtures")
+        self.endpoint = endpoint
+
+
+def describe_request(method: str, url: str, kwargs: dict) -> tuple:
+    """
+    Returns the endpoint a request is counted under and a key of everything that
+    decides its response. Credentials are left out of the key, as are json rpc
+    provider urls and call ids, which change between providers and runs.
+
+    return: tuple(endpoint, key)
+    """
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query) + list((kwargs.get("params") or {}).items())
+    params = sorted((name, str(value)) for name, value in params if name != "apikey")
+    location = parts.netloc + parts.path
+
+    body = kwargs.get("json")
+    if body == None and kwargs.get("data"):
+        try:
+            body = json.loads(kwargs["data"])
+        except (TypeError, ValueError):
+            body = kwargs["data"]
+            if isinstance(body, bytes):
+                body = body.decode("utf-8", "replace")
+
+    calls = body if isinstance(body, list) else [body]
+    if calls and all(isinstance(call, dict) and "jsonrpc" in call for call in calls):
+        methods = "/".join(sorted(set(call.get("method") for call in calls)))
+        endpoint = f"rpc {methods}"
+        if isinstance(body, list):
+            endpoint = f"rpc batch {methods}"
+        body = [{k: v for k, v in call.items() if k != "id"} for call in calls]
+        location = ""
+    elif "etherscan" in parts.netloc:
+        query = dict(params)
+        endpoint = f"etherscan {query.get('module')}.{query.get('action')}"
+    else:
+        endpoint = location
+
+    key = json.dumps([method.upper(), location, params, body], sort_keys=True)
+
+    return endpoint, hashlib.sha1(key.encode()).hexdigest()
+
+
+class HttpFixtures:
+    def __init__(self, path: str, record: bool = False):
+        """
+        The HTTP responses of one wallet's pipeline run. Once installed every
+        requests.Session request, which etherscan, web3 and DiggApi all go through, is
+        counted per endpoint and either recorded from the network or replayed from
+        the fixture at path.
+
+        tip_block: latest block the recording was made at, replayed runs are pinned
+            to it so they ask for the same ranges
+        address: wallet address the recording was made for
+        responses: dict(key: dict(endpoint, status, content_type, body))
+        """
+        self.path = path
+        self.record = record
+        self.tip_block = None
+        self.address = None
+        self.responses = {}
+        self.counts = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+
+        if not record:
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"No fixture at {path}, record it with `perf_report.py record`"
+                )
+            with gzip.open(path, "rt") as f:
+                fixture = json.load(f)
+            if fixture.get("version") != FIXTURE_VERSION:
+                raise ValueError(f"Fixture {path} has an unknown version")
+            self.tip_block = fixture["tip_block"]
+            self.address = fixture["address"]
+            self.responses = fixture["responses"]
+
+    def install(self):
+        send = requests.Session.request
+
+        def request(session, method, url, **kwargs):
+            return self._request(send, session, method, url, kwargs)
+
+        requests.Session.request = request
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        fixture = {
+            "version": FIXTURE_VERSION,
+            "tip_block": self.tip_block,
+            "address": self.address,
+            "responses": self.responses,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, "wt") as f:
+            json.dump(fixture, f)
+        os.replace(tmp_path, self.path)
+
+        logger.info(f"Recorded {len(self.responses)} responses to {self.path}")
+
+    def _request(self, send, session, method, url, kwargs) -> requests.Response:
+        endpoint, key = describe_request(method, url, kwargs)
+        with self._lock:
+            self.counts[endpoint] += 1
+
+        if self.record:
+            response = send(session, method, url, **kwargs)
+            with self._lock:
+                self.responses[key] = {
+                    "endpoint": endpoint,
+                    "status": response.status_code,
+                    "content_type": response.headers.get("Content-Type"),
+                    "body": response.content.decode("utf-8", "replace"),
+                }
+            return response
+
+        entry = self.responses.get(key)
+        if entry == None:
+            # answer like a failing service, so the clients' own error handling runs
+            # and measure reports the miss instead of crashing
+            logger.warning(FixtureMissing(endpoint))
+            with self._lock:
+                self.misses[endpoint] += 1
+            entry = MISSING_RESPONSE
+
+        body = entry["body"]
+        is_batch = endpoint.startswith("rpc batch")
+        if endpoint.startswith("rpc ") and not is_batch and entry != MISSING_RESPONSE:
+            # answer with the id web3 numbered this call with
+            response_body = json.loads(body)
+            response_body["id"] = json.loads(kwargs["data"]).get("id")
+            body = json.dumps(response_body)
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        if entry["content_type"]:
+            response.headers["Content-Type"] = entry["content_type"]
+        response.encoding = "utf-8"
+        response.url = url
+        response._content = body.encode()
+
+        return response
+
+
+class PinnedDiggApi(DiggApi):
+    def __init__(self, tip_block: int = None):
+        """
+        DiggApi that treats tip_block as the latest block. Left as None the live
+        latest block is looked up once and kept.
+        """
+        self.tip_block = tip_block
+        super().__init__()
+
+    def get_latest_block(self) -> int:
+        if self.tip_block == None:
+            self.tip_block = super().get_latest_block()
+
+        return self.tip_block
+
+
+class PhaseMeter:
+    def __init__(self, fixtures: HttpFixtures, trace_allocations: bool = False):
+        """
+        Measures each phase run is given, see run's phase argument.
+
+        phases: dict(name: dict(wall_time, requests, peak_rss[, allocated,
+            peak_allocated])). peak_rss is the process's high water mark by the
+            end of the phase, allocated the bytes allocated in the phase that are
+            still alive at its end and peak_allocated the most alive at once.
+        """
+        self.fixtures = fixtures
+        self.trace_allocations = trace_allocations
+        self.phases = {}
+
+    @contextmanager
+    def __call__(self, name: str):
+        requests_before = Counter(self.fixtures.counts)
+        if self.trace_allocations:
+            tracemalloc.clear_traces()
+        start = time.perf_counter()
+
+        yield
+
+        wall_time = time.perf_counter() - start
+        stats = {
+            "wall_time": wall_time,
+            "requests": dict(self.fixtures.counts - requests_before),
+            "peak_rss": peak_rss(),
+        }
+        if self.trace_allocations:
+            allocated, peak_allocated = tracemalloc.get_traced_memory()
+            stats["allocated"] = allocated
+            stats["peak_allocated"] = peak_allocated
+        self.phases[name] = stats
+
+
+def peak_rss() -> int:
+    """
+    Returns the process's peak resident set size in bytes.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # linux reports kilobytes, macos bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def fixture_path(wallet: str) -> str:
+    return os.path.join(PERF_FIXTURES_DIR, f"{wallet}.json.gz")
+
+
+def find_small_holder(api) -> str:
+    """
+    Returns a recent digg receiver that isn't a contract and has made at most
+    SMALL_HOLDER_MAX_TXS digg transfers, as the free etherscan plan can't list
+    holders by balance.
+    """
+    recent_txs = api.eth.get_erc20_token_transfer_events_by_contract_address_paginated(
+        contract_address=DIGG_ADDRESS,
+        page=1,
+        offset=SMALL_HOLDER_CANDIDATES,
+        sort="desc",
+    )
+    skip = set([ZERO_ADDRESS, DIGG_ADDRESS, BDIGG_ADDRESS, WBTC_DIGG_PAIR_ID])
+    candidates = dict.fromkeys(tx["to"] for tx in recent_txs if tx["to"] not in skip)
+    for address in candidates:
+        if api.web3.eth.getCode(api.web3.toChecksumAddress(address)):
+            continue
+        txs = api.eth.get_erc20_token_transfer_events_by_address_and_contract_paginated(
+            contract_address=DIGG_ADDRESS,
+            address=address,
+            page=1,
+            offset=SMALL_HOLDER_MAX_TXS + 1,
+            sort="asc",
+        )
+        if len(txs) <= SMALL_HOLDER_MAX_TXS:
+            logger.info(f"Using {address} with {len(txs)} transfers as small holder")
+            return address
+
+    raise ValueError(
+        "No small holder among recent digg receivers, set one in DIGG_IT_PERF_WALLETS"
+    )
+
+
+def measure(wallet: str, record: bool = False, trace_allocations: bool = False):
+    """
+    Runs the pipeline once for wallet in this process, meant to be called through
+    measure_wallet so every run starts from a fresh process and data directory.
+
+    A wallet without an address is a small holder picked when recording. Replays
+    use the address the fixture was recorded for.
+    """
+    fixtures = HttpFixtures(fixture_path(wallet), record)
+    fixtures.install()
+    if trace_allocations:
+        tracemalloc.start()
+
+    meter = PhaseMeter(fixtures, trace_allocations)
+    error = None
+    with meter("setup"):
+        api = PinnedDiggApi(fixtures.tip_block)
+    address = fixtures.address
+    if record:
+        address = PERF_WALLETS[wallet] or find_small_holder(api)
+    try:
+        run(api, address, meter)
+    except Exception as e:
+        # requests missing from the fixture surface as client errors, they're
+        # reported as misses rather than crashing the report
+        if record or not fixtures.misses:
+            raise
+        error = repr(e)
+
+    if record:
+        fixtures.tip_block = api.tip_block
+        fixtures.address = address
+        fixtures.save()
+
+    return {
+        "address": address,
+        "tip_block": api.tip_block,
+        "phases": meter.phases,
+        "misses": dict(fixtures.misses),
+        "error": error,
+    }
+
+
+def measure_wallet(
+    wallet: str, record: bool = False, trace_allocations: bool = False
+) -> dict:
+    with tempfile.TemporaryDirectory() as data_dir:
+        output_path = os.path.join(data_dir, "measurement.json")
+        env = dict(os.environ, DIGG_IT_DATA_DIR=data_dir)
+        command = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "measure",
+            wallet,
+            "--output",
+            output_path,
+        ]
+        if record:
+            command.append("--record")
+        else:
+            # a single provider, so replayed calls are never hedged
+            env["DIGG_IT_RPC_URLS"] = REPLAY_RPC_URL
+        if trace_allocations:
+            command.append("--trace-allocations")
+
+        subprocess.run(command, env=env, check=True)
+        with open(output_path, "r") as f:
+            return json.load(f)
+
+
+def profile_wallet(wallet: str, repeat: int = PERF_REPEAT) -> dict:
+    """
+    Replays wallet's pipeline repeat times for the fastest wall time and lowest
+    peak rss of each phase, then once more with allocation tracing, which slows
+    everything down too much to time.
+    """
+    runs = [measure_wallet(wallet)]
+    if runs[0]["misses"]:
+        # a stale fixture has nothing worth timing
+        return runs[0]
+    runs += [measure_wallet(wallet) for _ in range(repeat - 1)]
+    traced = measure_wallet(wallet, trace_allocations=True)
+
+    phases = {}
+    for phase, stats in traced["phases"].items():
+        phases[phase] = {
+            "wall_time": min(run["phases"][phase]["wall_time"] for run in runs),
+            "requests": stats["requests"],
+            "peak_rss": min(run["phases"][phase]["peak_rss"] for run in runs),
+            "allocated": stats["allocated"],
+            "peak_allocated": stats["peak_allocated"],
+        }
+
+    return {
+        "address": traced["address"],
+        "tip_block": traced["tip_block"],
+        "phases": phases,
+        "misses": {},
+    }
+
+
+def is_regression(kind: str, before: float, after: float, thresholds: dict) -> bool:
+    min_delta = thresholds.get(f"{kind}_min_delta", 0)
+
+    return after - before > max(before * thresholds[kind], min_delta)
+
+
+def compare(baseline: dict, profile: dict, thresholds: dict) -> list:
+    """
+    Compares a wallet's profile to its baseline phase by phase.
+
+    thresholds: dict(kind: allowed relative growth, kind_min_delta: growth that's
+        always allowed) for the time, memory and request kinds in METRICS
+
+    return: list(tuple(phase, metric, before, after, regressed)), requests are
+        compared per endpoint with metric "requests <endpoint>"
+    """
+    rows = []
+    for phase, stats in profile["phases"].items():
+        before_stats = baseline["phases"].get(phase)
+        if before_stats == None:
+            continue
+
+        for metric, kind in METRICS.items():
+            if metric == "requests":
+                endpoints = sorted(set(before_stats[metric]) | set(stats[metric]))
+                for endpoint in endpoints:
+                    before = before_stats[metric].get(endpoint, 0)
+                    after = stats[metric].get(endpoint, 0)
+                    rows.append(
+                        (
+                            phase,
+                            f"requests {endpoint}",
+                            before,
+                            after,
+                            is_regression(kind, before, after, thresholds),
+                        )
+                    )
+            elif metric in before_stats:
+                before = before_stats[metric]
+                after = stats[metric]
+                rows.append(
+                    (
+                        phase,
+                        metric,
+                        before,
+                        after,
+                        is_regression(kind, before, after, thresholds),
+                    )
+                )
+
+    return rows
+
+
+def load_baseline(path: str = PERF_BASELINE_PATH) -> dict:
+    """
+    {
+        "thresholds": thresholds the baseline was written with,
+        "wallets": {wallet: profile_wallet(wallet)},
+    }
+    """
+    if not os.path.exists(path):
+        return {"thresholds": {}, "wallets": {}}
+
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_baseline(baseline: dict, path: str = PERF_BASELINE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def format_metric(metric: str, value: float) -> str:
+    if metric == "wall_time":
+        return f"{value:.3f}s"
+    if metric in ("peak_rss", "allocated", "peak_allocated"):
+        return f"{value / (1 << 20):.1f}MiB"
+
+    return str(value)
+
+
+def report(wallets: list, baseline: dict, thresholds: dict, repeat: int) -> bool:
+    """
+    Profiles wallets and logs how each phase compares to the baseline. Returns
+    whether everything is within thresholds.
+    """
+    passed = True
+    for wallet in wallets:
+        if wallet not in baseline["wallets"]:
+            logger.warning(f"No baseline for {wallet}, skipping")
+            continue
+
+        profile = profile_wallet(wallet, repeat)
+        if profile["misses"]:
+            passed = False
+            logger.warning(f"Missing from {wallet} fixture: {profile['misses']}")
+            logger.warning(f"{wallet} replay failed with {profile['error']}")
+            continue
+
+        for phase, metric, before, after, regressed in compare(
+            baseline["wallets"][wallet], profile, thresholds
+        ):
+            change = f"{(after - before) / before:+.1%}" if before else "new"
+            line = (
+                f"{wallet}/{phase} {metric} {format_metric(metric, before)} -> "
+                f"{format_metric(metric, after)} ({change})"
+            )
+            if regressed:
+                passed = False
+                logger.warning(f"{line} REGRESSION")
+            elif metric in ("wall_time", "peak_rss", "peak_allocated") or after:
+                logger.info(line)
+
+    return passed
+
+
+def parse_args(args: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Replays digg_it against recorded fixtures and compares each "
+        "phase's wall time, requests and memory to a baseline"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="record fixtures from live services")
+    record.add_argument("wallets", nargs="*")
+
+    thresholds = argparse.ArgumentParser(add_help=False)
+    thresholds.add_argument("wallets", nargs="*")
+    thresholds.add_argument("--repeat", type=int, default=PERF_REPEAT)
+    thresholds.add_argument("--baseline", default=PERF_BASELINE_PATH)
+    thresholds.add_argument("--time-threshold", type=float)
+    thresholds.add_argument("--memory-threshold", type=float)
+    thresholds.add_argument("--request-threshold", type=float)
+    commands.add_parser(
+        "baseline", parents=[thresholds], help="write the baseline from fixtures"
+    )
+    commands.add_parser(
+        "report", parents=[thresholds], help="compare fixtures to the baseline"
+    )
+
+    measure = commands.add_parser("measure", help=argparse.SUPPRESS)
+    measure.add_argument("wallet")
+    measure.add_argument("--output", required=True)
+    measure.add_argument("--record", action="store_true")
+    measure.add_argument("--trace-allocations", action="store_true")
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+
+    if args.command == "measure":
+        # the pipeline's own progress would drown out the report
+        logger.setLevel(logging.WARNING)
+        measurement = measure(args.wallet, args.record, args.trace_allocations)
+        with open(args.output, "w") as f:
+            json.dump(measurement, f)
+        sys.exit(0)
+
+    wallets = args.wallets or list(PERF_WALLETS)
+    unknown = [wallet for wallet in wallets if wallet not in PERF_WALLETS]
+    if unknown:
+        sys.exit(f"Unknown wallets {unknown}, configure them in DIGG_IT_PERF_WALLETS")
+
+    if args.command == "record":
+        for wallet in wallets:
+            logger.info(f"Recording {wallet}")
+            measure_wallet(wallet, record=True)
+        sys.exit(0)
+
+    baseline = load_baseline(args.baseline)
+    thresholds = {
+        "time": PERF_TIME_THRESHOLD,
+        "time_min_delta": PERF_TIME_MIN_DELTA,
+        "memory": PERF_MEMORY_THRESHOLD,
+        "memory_min_delta": PERF_MEMORY_MIN_DELTA,
+        "request": PERF_REQUEST_THRESHOLD,
+    }
+    thresholds.update(baseline["thresholds"])
+    for kind in ("time", "memory", "request"):
+        if getattr(args, f"{kind}_threshold") != None:
+            thresholds[kind] = getattr(args, f"{kind}_threshold")
+
+    if args.command == "baseline":
+        for wallet in wallets:
+            logger.info(f"Profiling {wallet}")
+            profile = profile_wallet(wallet, args.repeat)
+            if profile["misses"]:
+                sys.exit(f"{wallet} fixture is missing {profile['misses']}")
+            baseline["wallets"][wallet] = profile
+        baseline["thresholds"] = thresholds
+        write_baseline(baseline, args.baseline)
+        logger.info(f"Wrote baseline for {wallets} to {args.baseline}")
+    elif not report(wallets, baseline, thresholds, args.repeat):
+        sys.exit(1)
@@ -0,0 +1,118 @@
+from decimal import Decimal
+
+from constants import COST_BASIS_METHOD, DIGG_INITIAL_SUPPLY
+from cost_basis import CostBasis
+from transaction import Transaction
+
+
+def format_transaction(api, address: str, tx: dict) -> Transaction:
+    """
+    Turns an etherscan erc20 transfer into a Transaction priced at its block.
+    """
+    if tx["to"] == str.lower(address):
+        tx["type"] = "buy"
+    else:
+        tx["type"] = "sell"
+    tx["totx_supply"] = api.get_digg_supply(tx["timeStamp"], api.rebases)
+    tx["totx_price"] = api.get_digg_price_at_block(int(tx["blockNumber"]))
+
+    return Transaction(tx)
+
+
+class Position:
+    def __init__(self, address: str, cost_basis_method: str = COST_BASIS_METHOD):
+        """
+        address: address the position belongs to
+        market_cap_pct: share of the total digg market cap currently held. Rebases
+            change every holder's balance by the same factor so the share only moves
+            with transfers.
+        usdc_profit / wbtc_profit: running sum of the market cap value bought and sold
+        last_block: block of the last transaction applied
+        cost_basis: lots matched by cost_basis_method for realized / unrealized P&L
+        vault_moves: dict(tx_hash: shares) of sett deposit / withdrawal legs whose
+            other leg hasn't been applied yet
+        """
+        self.address = address
+        self.market_cap_pct = Decimal(0)
+        self.usdc_profit = Decimal(0)
+        self.wbtc_profit = Decimal(0)
+        self.last_block = 0
+        self.cost_basis = CostBasis(cost_basis_method)
+        self.vault_moves = {}
+
+        self.digg_mcap_pct = []
+        self.digg_usdc_mcap_price = []
+        self.digg_wbtc_mcap_price = []
+
+    @property
+    def num_txs(self) -> int:
+        return len(self.digg_mcap_pct)
+
+    def apply(self, tx: Transaction):
+        digg_usdc_mcap = tx.totx_market_cap_price["mcap_usdc"]
+        digg_wbtc_mcap = tx.totx_market_cap_price["mcap_wbtc"]
+        shares = tx.market_cap_pct * DIGG_INITIAL_SUPPLY
+        usdc_value = tx.market_cap_pct * digg_usdc_mcap
+        wbtc_value = tx.market_cap_pct * digg_wbtc_mcap
+        if tx.tx_type == "buy":
+            self.digg_mcap_pct.append(tx.market_cap_pct)
+            self.usdc_profit -= usdc_value
+            self.wbtc_profit -= wbtc_value
+            if tx.vault_transfer:
+                self._move_vault_shares(tx.tx_hash, shares)
+            else:
+                self.cost_basis.buy(shares, usdc_value, wbtc_value)
+        else:
+            self.digg_mcap_pct.append(-tx.market_cap_pct)
+            self.usdc_profit += usdc_value
+            self.wbtc_profit += wbtc_value
+            if tx.vault_transfer:
+                self._move_vault_shares(tx.tx_hash, -shares)
+            else:
+                self.cost_basis.sell(shares, usdc_value, wbtc_value)
+
+        self.market_cap_pct += self.digg_mcap_pct[-1]
+        self.last_block = int(tx.block_number)
+
+        self.digg_usdc_mcap_price.append(digg_usdc_mcap)
+        self.digg_wbtc_mcap_price.append(digg_wbtc_mcap)
+
+    def _move_vault_shares(self, tx_hash: str, shares: Decimal):
+        """
+        Swapping digg for bDIGG in the sett isn't a disposal, the lots carry over with
+        their cost. Only what the two legs differ by, like a withdrawal fee kept by
+        the sett, leaves or joins the lots, at no proceeds or cost.
+        """
+        pending = self.vault_moves.pop(tx_hash, None)
+        if pending == None:
+            self.vault_moves[tx_hash] = shares
+            return
+
+        net_shares = pending + shares
+        if net_shares < 0:
+            self.cost_basis.sell(-net_shares, Decimal(0), Decimal(0))
+        elif net_shares > 0:
+            self.cost_basis.buy(net_shares, Decimal(0), Decimal(0))
+
+    def summary(self, market_cap: list = None) -> dict:
+        """
+        market_cap: latest entry of the historic market cap, used to value the
+            position still held.
+        """
+        summary = {
+            "address": self.address,
+            "last_block": self.last_block,
+            "num_txs": self.num_txs,
+            "market_cap_pct": self.market_cap_pct,
+            "usdc_profit": self.usdc_profit,
+            "wbtc_profit": self.wbtc_profit,
+            "cost_basis_method": self.cost_basis.method,
+            "realized_usdc": self.cost_basis.realized_usdc,
+            "realized_wbtc": self.cost_basis.realized_wbtc,
+        }
+        if market_cap:
+            summary["usdc_value"] = self.market_cap_pct * market_cap[1]
+            summary["wbtc_value"] = self.market_cap_pct * market_cap[2]
+            summary.update(self.cost_basis.unrealized(market_cap))
+
+        return summary
@@ -0,0 +1,126 @@
+from decimal import Decimal
+
+import numpy as np
+
+from constants import DIGG_ADDRESS, DIGG_INITIAL_SUPPLY, DIGG_START_BLOCK
+from supply_table import SupplyTable, build_supply_records
+
+# addresses and blocks are packed into one sortable key, blocks fit in 32 bits
+BLOCK_BITS = 32
+
+
+class PositionIndex:
+    def __init__(self, supply_table: SupplyTable, address_txs: dict):
+        """
+        Per address prefix sums of the digg transferred in and out, sorted by block, so
+        a position at any block is a binary search instead of a replay.
+
+        supply_table: rebase supply history used to turn transfers into shares
+        address_txs: dict(address: list(etherscan erc20 transfer)) of digg transfers
+
+        Balances are kept in shares, DIGG_INITIAL_SUPPLY / supply per digg at the time
+        of the transfer, which rebases don't change.
+        """
+        self.supply_table = supply_table
+        self.address_ids = {}
+
+        keys = []
+        shares = []
+        fragments = []
+        for address, txs in address_txs.items():
+            address = address.lower()
+            address_id = self.address_ids.setdefault(address, len(self.address_ids))
+            if not txs:
+                continue
+
+            blocks = np.array([int(tx["blockNumber"]) for tx in txs], dtype=np.uint64)
+            amounts = np.array(
+                [self._signed_amount(address, tx) for tx in txs], dtype=np.float64
+            )
+            order = np.argsort(blocks, kind="stable")
+            blocks = blocks[order]
+            amounts = amounts[order]
+
+            keys.append((np.uint64(address_id) << np.uint64(BLOCK_BITS)) | blocks)
+            shares.append(
+                np.cumsum(amounts * supply_table.shares_per_fragment_at_block(blocks))
+            )
+            fragments.append(np.cumsum(amounts))
+
+        self.keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.uint64)
+        self.cumulative_shares = np.concatenate(shares) if shares else np.zeros(0)
+        self.cumulative_fragments = (
+            np.concatenate(fragments) if fragments else np.zeros(0)
+        )
+
+    def position_at_block(self, address: str, block_number: int) -> dict:
+        """
+        return: {
+            "balance": digg held after block_number,
+            "shares": balance in shares,
+            "market_cap_pct": share of the total digg market cap held,
+            "net_transferred": digg received minus digg sent, ignoring rebases,
+        }
+        """
+        position = self.query([address], [block_number])
+
+        return {
+            field: Decimal(repr(float(values[0]))) for field, values in position.items()
+        }
+
+    def query(self, addresses: list, block_numbers: list) -> dict:
+        """
+        Vectorized position_at_block for many (address, block) pairs at once.
+        Addresses that aren't indexed hold nothing.
+
+        return: dict(field: np.ndarray) with the same fields as position_at_block
+        """
+        address_ids = np.array(
+            [self.address_ids.get(address.lower(), -1) for address in addresses],
+            dtype=np.int64,
+        )
+        block_numbers = np.asarray(block_numbers, dtype=np.uint64)
+        known = address_ids >= 0
+
+        query_keys = (
+            np.where(known, address_ids, 0).astype(np.uint64) << np.uint64(BLOCK_BITS)
+        ) | block_numbers
+        i = np.searchsorted(self.keys, query_keys, side="right") - 1
+        # the last transfer at or before the block has to belong to the same address
+        found = known & (i >= 0)
+        found_ids = self.keys[i[found]] >> np.uint64(BLOCK_BITS)
+        found[found] &= found_ids == address_ids[found].astype(np.uint64)
+
+        shares = np.zeros(len(found))
+        fragments = np.zeros(len(found))
+        shares[found] = self.cumulative_shares[i[found]]
+        fragments[found] = self.cumulative_fragments[i[found]]
+        shares_per_fragment = self.supply_table.shares_per_fragment_at_block(
+            block_numbers
+        )
+
+        return {
+            "balance": shares / shares_per_fragment,
+            "shares": shares,
+            "market_cap_pct": shares / DIGG_INITIAL_SUPPLY,
+            "net_transferred": fragments,
+        }
+
+    def _signed_amount(self, address: str, tx: dict) -> float:
+        if tx["from"] == tx["to"]:
+            return 0.0
+        amount = int(tx["value"]) / 10 ** int(tx.get("tokenDecimal", 0))
+
+        return amount if tx["to"] == address else -amount
+
+
+def build_position_index(api, addresses: list) -> PositionIndex:
+    supply_table = api.supply_table
+    if supply_table == None:
+        supply_table = SupplyTable(build_supply_records(api))
+
+    address_txs = api.get_addresses_erc20_token_txs(
+        DIGG_START_BLOCK, addresses, DIGG_ADDRESS
+    )
+
+    return PositionIndex(supply_table, address_txs)
@@ -0,0 +1,69 @@
+import logging
+
+from constants import PRICE_BLOCK_TOLERANCE
+from thread_pool import map_threaded
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+
+class PricePlanner:
+    def __init__(self, api, tolerance: int = PRICE_BLOCK_TOLERANCE):
+        """
+        Collects every block that needs a price before any are fetched, so each
+        distinct price point is only queried once.
+
+        tolerance: blocks are snapped down to a multiple of tolerance and share the
+            price at that block. 0 or 1 prices every block exactly.
+        """
+        self.api = api
+        self.tolerance = tolerance
+        self.blocks = set()
+
+    def add(self, block_number: int):
+        self.blocks.add(int(block_number))
+
+    def add_many(self, block_numbers):
+        for block_number in block_numbers:
+            self.add(block_number)
+
+    def snap(self, block_number: int) -> int:
+        if self.tolerance <= 1:
+            return block_number
+
+        return block_number - block_number % self.tolerance
+
+    def fetch(self):
+        """
+        Prices every planned block into api.price_cache, where get_digg_price_at_block
+        picks them up. Blocks priced at their snapped block are only recorded in
+        api.snapped_blocks, so the approximate price isn't cached as theirs.
+        """
+        price_points = {}
+        for block_number in self.blocks:
+            if (
+                block_number not in self.api.price_cache
+                and block_number not in self.api.snapped_blocks
+            ):
+                price_points.setdefault(self.snap(block_number), []).append(
+                    block_number
+                )
+
+        logger.info(
+            f"Pricing {len(self.blocks)} blocks with {len(price_points)} price points"
+        )
+
+        price_blocks = sorted(price_points)
+        prices = map_threaded(self.api.get_digg_price_at_block, price_blocks)
+        for price_block, price in zip(price_blocks, prices):
+            for block_number in price_points[price_block]:
+                if block_number == price_block:
+                    continue
+                # snapping can land before the digg wbtc pool existed, price those
+                # blocks exactly instead
+                if price["digg_wbtc_price"] == None:
+                    self.api.get_digg_price_at_block(block_number)
+                else:
+                    self.api.snapped_blocks[block_number] = price_block
+
+        self.blocks = set()
@@ -0,0 +1,176 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+
+from web3.providers import BaseProvider, HTTPProvider
+
+from constants import (
+    RPC_HEDGE_MIN_SAMPLES,
+    RPC_PROVIDER_COOLDOWN,
+    RPC_PROVIDER_MAX_ERRORS,
+)
+from rpc_batch import send_batch
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+
+class ProviderStats:
+    def __init__(self, endpoint_uri: str):
+        """
+        latencies: seconds taken by the most recent successful calls
+        consecutive_errors: failed calls since the last success
+        unhealthy_until: time before which the provider is only used as a last resort
+        """
+        self.endpoint_uri = endpoint_uri
+        self.latencies = deque(maxlen=100)
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.unhealthy_until = 0
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def percentile(self, pct: float) -> float:
+        """
+        Returns None until the provider has served a call.
+        """
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+
+        return latencies[min(int(len(latencies) * pct), len(latencies) - 1)]
+
+
+class ProviderPool(BaseProvider):
+    def __init__(self, endpoint_uris: list, hedge: bool = True, request_kwargs=None):
+        """
+        Routes json rpc calls to the fastest healthy of several endpoints. A call that
+        takes longer than the provider's p95 latency is sent again to the next
+        fastest provider and whichever answers first wins. Failed calls fall over to
+        the remaining providers, and a provider that fails RPC_PROVIDER_MAX_ERRORS
+        times in a row is benched for RPC_PROVIDER_COOLDOWN seconds.
+        """
+        if not endpoint_uris:
+            raise ValueError("ProviderPool needs at least one endpoint")
+
+        self.providers = [
+            HTTPProvider(endpoint_uri, request_kwargs=request_kwargs)
+            for endpoint_uri in endpoint_uris
+        ]
+        self.stats = [ProviderStats(endpoint_uri) for endpoint_uri in endpoint_uris]
+        self.hedge = hedge
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(self.providers))
+
+    def make_request(self, method, params):
+        return self._dispatch(
+            lambda provider: provider.make_request(method, params),
+            method,
+            hedge=self.hedge,
+            record_latency=True,
+        )
+
+    def make_batch_request(self, payload: list) -> list:
+        """
+        Sends a json rpc batch payload to the fastest healthy provider. Batches take
+        longer than single calls so they aren't hedged or counted towards latency.
+        """
+        return self._dispatch(
+            lambda provider: send_batch(provider, payload),
+            "batch",
+            hedge=False,
+            record_latency=False,
+        )
+
+    def _dispatch(self, request, label: str, hedge: bool, record_latency: bool):
+        ranked = self._ranked()
+        pending = {self._submit(ranked[0], request, record_latency): ranked[0]}
+        untried = ranked[1:]
+
+        hedge_after = self._hedge_after(ranked[0]) if hedge else None
+
+        error = None
+        while pending:
+            # there's nothing to hedge to once every provider has been tried
+            timeout = hedge_after if untried else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # the call is slower than this provider's p95, race a duplicate
+                index = untried.pop(0)
+                logger.debug(f"Hedging {label} to {self.stats[index].endpoint_uri}")
+                pending[self._submit(index, request, record_latency)] = index
+                hedge_after = None
+                continue
+
+            for future in done:
+                pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+            if not pending and untried:
+                index = untried.pop(0)
+                pending[self._submit(index, request, record_latency)] = index
+                # the failover's own latency decides when it's worth hedging
+                hedge_after = self._hedge_after(index) if hedge else None
+
+        raise error
+
+    def _hedge_after(self, index: int) -> float:
+        """
+        Returns the provider's p95 latency, or None until it has enough samples to
+        tell a slow call apart.
+        """
+        stats = self.stats[index]
+        if len(stats.latencies) < RPC_HEDGE_MIN_SAMPLES:
+            return None
+
+        return stats.percentile(0.95)
+
+    def isConnected(self) -> bool:
+        return any(provider.isConnected() for provider in self.providers)
+
+    def _ranked(self) -> list:
+        """
+        Returns provider indexes, healthy ones first, fastest median latency first.
+        Providers without latency samples yet are tried before measured ones.
+        """
+        now = time.time()
+        with self._lock:
+            return sorted(
+                range(len(self.providers)),
+                key=lambda i: (
+                    not self.stats[i].is_healthy(now),
+                    self.stats[i].percentile(0.5) or 0,
+                ),
+            )
+
+    def _submit(self, index: int, request, record_latency: bool):
+        return self._executor.submit(self._call, index, request, record_latency)
+
+    def _call(self, index: int, request, record_latency: bool):
+        stats = self.stats[index]
+        start = time.time()
+        try:
+            response = request(self.providers[index])
+        except Exception:
+            with self._lock:
+                stats.calls += 1
+                stats.errors += 1
+                stats.consecutive_errors += 1
+                if stats.consecutive_errors >= RPC_PROVIDER_MAX_ERRORS:
+                    stats.unhealthy_until = time.time() + RPC_PROVIDER_COOLDOWN
+                    logger.warning(f"Benching unhealthy provider {stats.endpoint_uri}")
+            raise
+
+        with self._lock:
+            stats.calls += 1
+            stats.consecutive_errors = 0
+            if record_latency:
+                stats.latencies.append(time.time() - start)
+
+        return response
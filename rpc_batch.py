@@ -0,0 +1,100 @@
+import json
+import logging
+
+from web3._utils.request import make_post_request
+
+from constants import RPC_BATCH_SIZE
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+
+class RpcBatchError(Exception):
+    def __init__(self, method: str, error):
+        super().__init__(f"{method} failed: {error}")
+        self.method = method
+        self.error = error
+
+
+def send_batch(provider, payload: list) -> list:
+    """
+    Posts a json rpc batch payload to an HTTPProvider's endpoint.
+    """
+    response = make_post_request(
+        provider.endpoint_uri,
+        json.dumps(payload).encode(),
+        **provider.get_request_kwargs(),
+    )
+
+    return json.loads(response)
+
+
+class RpcBatch:
+    def __init__(self, web3, batch_size: int = RPC_BATCH_SIZE):
+        """
+        Queues independent json rpc calls and sends them batch_size at a time in one
+        HTTP payload each.
+        """
+        self.web3 = web3
+        self.batch_size = batch_size
+        self.calls = []
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+    def add(self, method: str, params: list) -> int:
+        """
+        Returns the index of the call's result in execute's return value.
+        """
+        self.calls.append((method, params))
+
+        return len(self.calls) - 1
+
+    def execute(self) -> list:
+        """
+        Sends every queued call and clears the queue. A call that failed has an
+        RpcBatchError in place of its result, the rest of the batch still succeeds.
+
+        return: list of raw json rpc results in the order the calls were added
+        """
+        results = []
+        for start in range(0, len(self.calls), self.batch_size):
+            results.extend(self._send(self.calls[start : start + self.batch_size]))
+
+        logger.debug(
+            f"Sent {len(self.calls)} rpc calls in "
+            f"{-(-len(self.calls) // self.batch_size)} batches"
+        )
+        self.calls = []
+
+        return results
+
+    def _send(self, calls: list) -> list:
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(calls)
+        ]
+
+        provider = self.web3.provider
+        if hasattr(provider, "make_batch_request"):
+            responses = provider.make_batch_request(payload)
+        else:
+            responses = send_batch(provider, payload)
+
+        # a provider that rejects the whole batch answers with a single error object
+        if isinstance(responses, dict):
+            error = responses.get("error", responses)
+            return [RpcBatchError(method, error) for method, _ in calls]
+
+        responses = {response.get("id"): response for response in responses}
+        results = []
+        for i, (method, _) in enumerate(calls):
+            response = responses.get(i)
+            if response == None:
+                results.append(RpcBatchError(method, "missing from batch response"))
+            elif "error" in response:
+                results.append(RpcBatchError(method, response["error"]))
+            else:
+                results.append(response.get("result"))
+
+        return results
@@ -0,0 +1,155 @@
+from bisect import bisect_right
+import heapq
+
+from constants import MARKET_CAP_MIN_BLOCK_GAP, THREAD_POOL_SIZE
+from thread_pool import map_threaded
+
+
+def lttb(points: list, threshold: int) -> list:
+    """
+    Largest triangle three buckets downsampling. Keeps the first and last point and
+    from each bucket in between the point forming the largest triangle with the
+    point kept before it and the average of the next bucket, which preserves the
+    visual shape of the series.
+
+    points: list(list(x, y, ...)) sorted by x, the extra columns are carried along
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, len(points))
+
+        next_bucket = points[end:next_end] or [points[-1]]
+        avg_x = sum(float(p[0]) for p in next_bucket) / len(next_bucket)
+        avg_y = sum(float(p[1]) for p in next_bucket) / len(next_bucket)
+
+        ax = float(points[a][0])
+        ay = float(points[a][1])
+        best = start
+        best_area = -1.0
+        for j in range(start, end):
+            area = abs(
+                (ax - avg_x) * (float(points[j][1]) - ay)
+                - (ax - float(points[j][0])) * (avg_y - ay)
+            )
+            if area > best_area:
+                best = j
+                best_area = area
+
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+
+    return sampled
+
+
+def min_max_buckets(points: list, buckets: int) -> list:
+    """
+    Keeps the lowest and highest y of each of buckets equal sized buckets, in x
+    order, so spikes survive downsampling.
+    """
+    if buckets * 2 >= len(points) or buckets < 1:
+        return list(points)
+
+    sampled = []
+    bucket_size = len(points) / buckets
+    for i in range(buckets):
+        bucket = points[int(i * bucket_size) : int((i + 1) * bucket_size)]
+        if not bucket:
+            continue
+        low = min(range(len(bucket)), key=lambda j: float(bucket[j][1]))
+        high = max(range(len(bucket)), key=lambda j: float(bucket[j][1]))
+        for j in sorted(set([low, high])):
+            sampled.append(bucket[j])
+
+    return sampled
+
+
+def downsample(points: list, target: int, method: str = "lttb") -> list:
+    if method == "lttb":
+        return lttb(points, target)
+    if method == "minmax":
+        return min_max_buckets(points, target // 2)
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+
+def adaptive_sample(
+    sample,
+    start_block: int,
+    end_block: int,
+    resolution: int,
+    threshold: float,
+    breakpoints: dict = None,
+) -> list:
+    """
+    Samples a series densely only where it moves. Starts from an even grid of a
+    quarter of resolution points, then keeps splitting the interval whose ends
+    differ the most, relative to their value, until resolution points are taken or
+    no interval changes by more than threshold. The jumps at breakpoint blocks, e.g.
+    a rebase changing the supply, inside an interval count as its change too, so
+    stretches with many or large rebases are split before quiet ones.
+
+    sample: function(block) -> list(timestamp, y, ...) or None where there's no data
+    breakpoints: dict(block: relative change of the series at block)
+
+    return: list(tuple(block, entry)) sorted by block, without missing entries
+    """
+    grid_size = max(min(resolution // 4, end_block - start_block + 1), 2)
+    step = (end_block - start_block) / (grid_size - 1)
+    blocks = sorted(set(int(start_block + i * step) for i in range(grid_size)))
+    samples = dict(zip(blocks, map_threaded(sample, blocks)))
+    breakpoints = breakpoints or {}
+    breakpoint_blocks = sorted(breakpoints)
+    # running total of the breakpoint jumps, so an interval's is two lookups
+    jumps = [0.0]
+    for block in breakpoint_blocks:
+        jumps.append(jumps[-1] + abs(breakpoints[block]))
+
+    def score(a: int, b: int) -> float:
+        if b - a < 2 * MARKET_CAP_MIN_BLOCK_GAP:
+            return 0
+        jump = (
+            jumps[bisect_right(breakpoint_blocks, b)]
+            - jumps[bisect_right(breakpoint_blocks, a)]
+        )
+        if samples[a] == None or samples[b] == None:
+            # only one side has data, narrow down where it starts
+            return float("inf") if samples[a] != samples[b] else jump
+        ya = float(samples[a][1])
+        yb = float(samples[b][1])
+        low = min(abs(ya), abs(yb))
+
+        return max(abs(yb - ya) / low if low else float("inf"), jump)
+
+    heap = []
+    for a, b in zip(blocks, blocks[1:]):
+        heapq.heappush(heap, (-score(a, b), a, b))
+
+    while heap and len(samples) < resolution:
+        # split a round of the most changing intervals at once so their samples
+        # can be fetched in parallel
+        intervals = []
+        while heap and len(intervals) < THREAD_POOL_SIZE:
+            priority, a, b = heapq.heappop(heap)
+            if -priority <= threshold:
+                heap = []
+                break
+            intervals.append((a, b))
+        intervals = intervals[: resolution - len(samples)]
+        if not intervals:
+            break
+
+        middles = [(a + b) // 2 for a, b in intervals]
+        for middle, entry in zip(middles, map_threaded(sample, middles)):
+            samples[middle] = entry
+        for (a, b), middle in zip(intervals, middles):
+            heapq.heappush(heap, (-score(a, middle), a, middle))
+            heapq.heappush(heap, (-score(middle, b), middle, b))
+
+    return [(block, samples[block]) for block in sorted(samples) if samples[block]]
@@ -0,0 +1,312 @@
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import re
+import sys
+from urllib.parse import parse_qs, parse_qsl, urlsplit
+
+from constants import (
+    SERVER_HOST,
+    SERVER_MAX_POSITIONS,
+    SERVER_MAX_RESOLUTION,
+    SERVER_MAX_RESPONSES,
+    SERVER_PORT,
+    WATCH_POLL_INTERVAL,
+)
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+from digg_api import DiggApi
+from series import downsample
+from watch import PositionWatcher
+
+HTTP_REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+ADDRESS_PATTERN = re.compile("^0x[0-9a-f]{40}$")
+
+PNL_FIELDS = (
+    "usdc_profit",
+    "wbtc_profit",
+    "cost_basis_method",
+    "realized_usdc",
+    "realized_wbtc",
+    "unrealized_usdc",
+    "unrealized_wbtc",
+)
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class QueryServer:
+    def __init__(self, api: DiggApi, poll_interval: int = WATCH_POLL_INTERVAL):
+        """
+        Serves position, P&L and market cap queries from one warm DiggApi.
+
+        The watcher does all the blocking work in the default executor and is only
+        touched while holding lock. The transfer history of a newly queried address
+        is crawled outside the lock, once however many queries ask for it, and only
+        the blocks the watcher moved past meanwhile are applied under it.
+
+        watched: the SERVER_MAX_POSITIONS most recently queried addresses, the
+            watcher stops updating the rest
+        responses: response bodies by path and query, the SERVER_MAX_RESPONSES most
+            recent kept until the watcher moves past the block they were built at,
+            so repeated queries never wait on an update
+        """
+        self.watcher = PositionWatcher(api, [])
+        self.poll_interval = poll_interval
+        self.lock = asyncio.Lock()
+        self.loading = {}
+        self.watched = OrderedDict()
+        self.responses = OrderedDict()
+
+    async def start(self, host: str = SERVER_HOST, port: int = SERVER_PORT):
+        await self._update()
+        asyncio.create_task(self._poll())
+
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Serving on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = await self._read_headers(reader)
+
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    await self._respond(writer, 400)
+                    break
+                method, path, _ = parts
+                if method != "GET":
+                    await self._respond(writer, 405)
+                else:
+                    await self._serve(writer, path, headers)
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self, writer, path: str, headers: dict):
+        try:
+            response = await self._get_response(path)
+        except BadRequest as e:
+            logger.info(f"Bad request {path}: {e}")
+            await self._respond(writer, 400)
+            return
+        except Exception:
+            logger.exception(f"Query {path} failed")
+            await self._respond(writer, 500)
+            return
+
+        if response == None:
+            await self._respond(writer, 404)
+        elif headers.get("if-none-match") == response["etag"]:
+            await self._respond(writer, 304, etag=response["etag"])
+        else:
+            await self._respond(
+                writer, 200, etag=response["etag"], body=response["body"]
+            )
+
+    async def _read_headers(self, reader) -> dict:
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def _respond(self, writer, status: int, etag: str = None, body: bytes = b""):
+        lines = [
+            f"HTTP/1.1 {status} {HTTP_REASONS[status]}",
+            f"Content-Length: {len(body)}",
+            "Cache-Control: no-cache",
+        ]
+        if body:
+            lines.append("Content-Type: application/json")
+        if etag:
+            lines.append(f"ETag: {etag}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _get_response(self, path: str) -> dict:
+        url = urlsplit(path)
+        key = (url.path, tuple(sorted(parse_qsl(url.query))))
+        response = self.responses.get(key)
+        if response and response["block"] == self.watcher.last_block:
+            self.responses.move_to_end(key)
+            return response
+
+        parts = url.path.strip("/").split("/")
+        query = parse_qs(url.query)
+        if len(parts) == 2 and parts[0] in ("position", "pnl"):
+            await self._watch(parts[1].lower())
+
+        if parts == ["market-cap"] and "resolution" in query:
+            # sampling only reads the api, so it doesn't hold up the watcher
+            block = self.watcher.last_block
+            data = await self._market_cap_series(query)
+        else:
+            async with self.lock:
+                block = self.watcher.last_block
+                data = self._query(url)
+        if data == None:
+            return None
+
+        body = json.dumps(data, default=str).encode()
+        response = {
+            "block": block,
+            "etag": f'"{hashlib.sha1(body).hexdigest()}"',
+            "body": body,
+        }
+
+        self.responses[key] = response
+        self.responses.move_to_end(key)
+        while len(self.responses) > SERVER_MAX_RESPONSES:
+            self.responses.popitem(last=False)
+
+        return response
+
+    def _query(self, url) -> dict:
+        """
+        /position/<address>
+        /pnl/<address>, an address without digg or bDIGG transfers gets an empty
+            position
+        /market-cap?points=<n>&method=<lttb|minmax>
+        /market-cap?resolution=<n>&start=<timestamp>&end=<timestamp>, see
+            _market_cap_series
+        """
+        parts = url.path.strip("/").split("/")
+
+        if parts == ["market-cap"]:
+            query = parse_qs(url.query)
+            market_cap = self.watcher.market_cap
+            if "points" in query:
+                try:
+                    market_cap = downsample(
+                        market_cap,
+                        int(query["points"][0]),
+                        query.get("method", ["lttb"])[0],
+                    )
+                except ValueError as e:
+                    raise BadRequest(str(e))
+            return {"last_block": self.watcher.last_block, "market_cap": market_cap}
+
+        if len(parts) != 2 or parts[0] not in ("position", "pnl"):
+            return None
+
+        position = self.watcher.positions.get(parts[1].lower())
+        if position == None:
+            return None
+
+        market_cap = self.watcher.market_cap[-1] if self.watcher.market_cap else None
+        summary = position.summary(market_cap)
+        summary["synced_block"] = self.watcher.last_block
+        if parts[0] == "position":
+            for field in PNL_FIELDS:
+                summary.pop(field, None)
+
+        return summary
+
+    async def _market_cap_series(self, query: dict) -> dict:
+        """
+        Samples about resolution market cap points between the optional start and
+        end timestamps, densest around rebases and where the market cap moved, with
+        DiggApi.get_market_cap_series.
+        """
+        try:
+            resolution = int(query["resolution"][0])
+            start = int(query["start"][0]) if "start" in query else None
+            end = int(query["end"][0]) if "end" in query else None
+        except ValueError as e:
+            raise BadRequest(str(e))
+        if not 2 <= resolution <= SERVER_MAX_RESOLUTION:
+            raise BadRequest(f"resolution must be from 2 to {SERVER_MAX_RESOLUTION}")
+        if start != None and end != None and start >= end:
+            raise BadRequest("start must be before end")
+
+        loop = asyncio.get_running_loop()
+        market_cap = await loop.run_in_executor(
+            None, self.watcher.api.get_market_cap_series, resolution, start, end
+        )
+
+        return {"last_block": self.watcher.last_block, "market_cap": market_cap}
+
+    async def _watch(self, address: str):
+        """
+        Makes sure the watcher follows address, loading it if it's new.
+        """
+        if not ADDRESS_PATTERN.match(address):
+            raise BadRequest(f"Invalid address {address}")
+
+        if address not in self.watcher.positions:
+            loading = self.loading.get(address)
+            if loading == None:
+                loading = asyncio.ensure_future(self._load(address))
+                self.loading[address] = loading
+                loading.add_done_callback(lambda _: self.loading.pop(address, None))
+            # a client hanging up mustn't cancel the crawl other queries wait on
+            await asyncio.shield(loading)
+
+        if address in self.watched:
+            self.watched.move_to_end(address)
+
+    async def _load(self, address: str):
+        loop = asyncio.get_running_loop()
+        synced_block = self.watcher.last_block
+        position = await loop.run_in_executor(
+            None, self.watcher.load_position, address, synced_block
+        )
+
+        async with self.lock:
+            await loop.run_in_executor(
+                None, self.watcher.add_position, position, synced_block
+            )
+            self.watched[address] = True
+            while len(self.watched) > SERVER_MAX_POSITIONS:
+                evicted, _ = self.watched.popitem(last=False)
+                self.watcher.remove_address(evicted)
+                logger.info(f"Stopped watching {evicted}")
+
+    async def _update(self):
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            if await loop.run_in_executor(None, self.watcher.update):
+                logger.info(f"Updated to block {self.watcher.last_block}")
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._update()
+            except Exception:
+                logger.exception("Update failed, retrying next poll")
+
+
+if __name__ == "__main__":
+    host = sys.argv[1] if len(sys.argv) > 1 else SERVER_HOST
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else SERVER_PORT
+
+    asyncio.run(QueryServer(DiggApi()).start(host, port))
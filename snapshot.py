@@ -0,0 +1,270 @@
+import logging
+import os
+import sys
+
+import numpy as np
+
+from constants import (
+    DIGG_ADDRESS,
+    DIGG_DECIMALS,
+    DIGG_INITIAL_SUPPLY,
+    DIGG_START_BLOCK,
+    ETH_BLOCKS_PER_DAY,
+    TRANSFER_INDEX_PATH,
+    ZERO_ADDRESS,
+)
+from supply_table import SupplyTable
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+# keccak("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+
+class TransferHistory:
+    def __init__(self, holders: list, blocks, from_ids, to_ids, shares):
+        """
+        Every digg transfer as columns sorted by block. Addresses are stored once in
+        holders and referenced by their index, amounts are in shares so they don't
+        need adjusting for later rebases.
+        """
+        self.holders = list(holders)
+        self.holder_ids = {address: i for i, address in enumerate(self.holders)}
+        self.blocks = np.asarray(blocks, dtype=np.uint64)
+        self.from_ids = np.asarray(from_ids, dtype=np.uint32)
+        self.to_ids = np.asarray(to_ids, dtype=np.uint32)
+        self.shares = np.asarray(shares, dtype=np.float64)
+
+    @property
+    def tip_block(self) -> int:
+        return int(self.blocks[-1]) if len(self.blocks) else DIGG_START_BLOCK - 1
+
+    def holder_id(self, address: str) -> int:
+        if address not in self.holder_ids:
+            self.holder_ids[address] = len(self.holders)
+            self.holders.append(address)
+
+        return self.holder_ids[address]
+
+    def extend(self, logs: list, supply_table: SupplyTable):
+        """
+        Appends raw Transfer logs from eth_getLogs, which must be newer than tip_block.
+        """
+        if not logs:
+            return
+
+        blocks = np.array([int(log["blockNumber"], 16) for log in logs], np.uint64)
+        from_ids = [self.holder_id("0x" + log["topics"][1][-40:]) for log in logs]
+        to_ids = [self.holder_id("0x" + log["topics"][2][-40:]) for log in logs]
+        amounts = np.array([int(log["data"], 16) for log in logs], np.float64)
+        amounts /= 10 ** DIGG_DECIMALS
+        shares = amounts * supply_table.shares_per_fragment_at_block(blocks)
+
+        self.blocks = np.concatenate([self.blocks, blocks])
+        self.from_ids = np.concatenate([self.from_ids, np.array(from_ids, np.uint32)])
+        self.to_ids = np.concatenate([self.to_ids, np.array(to_ids, np.uint32)])
+        self.shares = np.concatenate([self.shares, shares])
+
+    def save(self, path: str = TRANSFER_INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # np.savez adds .npz to names without it, so write to a name that has it
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            holders=np.array(self.holders),
+            blocks=self.blocks,
+            from_ids=self.from_ids,
+            to_ids=self.to_ids,
+            shares=self.shares,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = TRANSFER_INDEX_PATH):
+        if not os.path.exists(path):
+            return cls([], [], [], [], [])
+
+        with np.load(path) as index:
+            return cls(
+                index["holders"].tolist(),
+                index["blocks"],
+                index["from_ids"],
+                index["to_ids"],
+                index["shares"],
+            )
+
+
+def sync_transfer_history(
+    api, supply_table: SupplyTable, path: str = TRANSFER_INDEX_PATH
+) -> TransferHistory:
+    """
+    Fetches the digg transfers after the stored tip block and saves the index.
+    """
+    history = TransferHistory.load(path)
+    log_filter = {
+        "address": api.web3.toChecksumAddress(DIGG_ADDRESS),
+        "topics": [TRANSFER_TOPIC],
+    }
+    logs = api.get_logs_batched(log_filter, history.tip_block + 1, api.latest_block)
+    history.extend(logs, supply_table)
+    history.save(path)
+    logger.info(f"Indexed {len(logs)} new transfers up to block {api.latest_block}")
+
+    return history
+
+
+class HolderSnapshot:
+    def __init__(
+        self,
+        history: TransferHistory,
+        supply_table: SupplyTable,
+        block_number: int,
+        shares: np.ndarray,
+    ):
+        """
+        Every holder's digg position after block_number.
+
+        shares: balance in shares indexed by holder id
+        """
+        self.history = history
+        self.supply_table = supply_table
+        self.block_number = block_number
+        self.shares = shares
+
+    @property
+    def market_cap_pct(self) -> np.ndarray:
+        return self.shares / DIGG_INITIAL_SUPPLY
+
+    @property
+    def shares_per_fragment(self) -> float:
+        return self.supply_table.shares_per_fragment_at_block([self.block_number])[0]
+
+    @property
+    def balances(self) -> np.ndarray:
+        return self.shares / self.shares_per_fragment
+
+    def holder_ids(self) -> np.ndarray:
+        """
+        Holder ids with a balance of at least one digg base unit, largest first. The
+        float share sums leave holders who sent everything with rounding dust, so
+        anything under half a base unit is treated as empty. The zero address is the
+        mint and burn counterparty, not a holder.
+        """
+        dust = self.shares_per_fragment / 10 ** DIGG_DECIMALS / 2
+        held = self.shares > dust
+        zero_id = self.history.holder_ids.get(ZERO_ADDRESS)
+        if zero_id != None and zero_id < len(held):
+            held[zero_id] = False
+        ids = np.nonzero(held)[0]
+
+        return ids[np.argsort(-self.shares[ids], kind="stable")]
+
+    def summary(self, top_n: int = 10, percentiles: tuple = (1, 10, 50)) -> dict:
+        """
+        top: the top_n holders by balance
+        gini: gini coefficient of holder balances, 0 is perfectly even
+        concentration: share of the market cap held by the top n% of holders for
+            each n in percentiles
+        """
+        ids = self.holder_ids()
+        market_cap_pct = self.market_cap_pct[ids]
+        balances = self.balances[ids]
+
+        top = [
+            {
+                "address": self.history.holders[i],
+                "balance": float(balance),
+                "market_cap_pct": float(pct),
+            }
+            for i, balance, pct in zip(
+                ids[:top_n], balances[:top_n], market_cap_pct[:top_n]
+            )
+        ]
+
+        concentration = {}
+        cumulative_pct = np.cumsum(market_cap_pct)
+        for pct in percentiles:
+            count = max(int(np.ceil(len(ids) * pct / 100)), 1)
+            concentration[pct] = float(cumulative_pct[count - 1]) if len(ids) else 0.0
+
+        return {
+            "block_number": self.block_number,
+            "holders": len(ids),
+            "top": top,
+            "gini": gini(balances),
+            "concentration": concentration,
+        }
+
+
+def gini(values: np.ndarray) -> float:
+    if len(values) == 0 or values.sum() == 0:
+        return 0.0
+    values = np.sort(values)
+    n = len(values)
+    ranks = np.arange(1, n + 1)
+
+    return float(2 * np.sum(ranks * values) / (n * values.sum()) - (n + 1) / n)
+
+
+def compute_snapshot(
+    history: TransferHistory,
+    supply_table: SupplyTable,
+    block_number: int,
+    previous: HolderSnapshot = None,
+) -> HolderSnapshot:
+    """
+    Sums every transfer up to block_number into per holder balances. Given an earlier
+    previous snapshot only the transfers after it are added.
+    """
+    start = 0
+    shares = np.zeros(len(history.holders))
+    if previous != None and previous.block_number <= block_number:
+        start = np.searchsorted(history.blocks, previous.block_number, side="right")
+        shares[: len(previous.shares)] = previous.shares
+    end = np.searchsorted(history.blocks, block_number, side="right")
+
+    size = len(history.holders)
+    shares += np.bincount(
+        history.to_ids[start:end], weights=history.shares[start:end], minlength=size
+    )
+    shares -= np.bincount(
+        history.from_ids[start:end], weights=history.shares[start:end], minlength=size
+    )
+
+    return HolderSnapshot(history, supply_table, block_number, shares)
+
+
+def daily_snapshots(
+    history: TransferHistory,
+    supply_table: SupplyTable,
+    start_block: int,
+    end_block: int,
+):
+    """
+    Yields a snapshot every ETH_BLOCKS_PER_DAY blocks, each built from the last.
+    """
+    snapshot = None
+    for block_number in range(start_block, end_block + 1, ETH_BLOCKS_PER_DAY):
+        snapshot = compute_snapshot(history, supply_table, block_number, snapshot)
+        yield snapshot
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    from digg_api import DiggApi
+    from supply_table import sync_supply_table
+
+    api = DiggApi()
+    # transfers are converted to shares with the supply at their block, so the
+    # table has to cover every rebase up to the latest block
+    supply_table = sync_supply_table(api)
+
+    history = sync_transfer_history(api, supply_table)
+    block_number = int(sys.argv[1]) if len(sys.argv) > 1 else api.latest_block
+    snapshot = compute_snapshot(history, supply_table, block_number)
+    logger.info(snapshot.summary())
@@ -0,0 +1,224 @@
+import calendar
+from datetime import datetime
+from decimal import Decimal
+import logging
+import mmap
+import os
+import sys
+
+import numpy as np
+
+from constants import DIGG_INITIAL_SUPPLY, SUPPLY_TABLE_PATH
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+SUPPLY_TABLE_MAGIC = b"DIGGSUP1"
+# Packed little endian records, oldest rebase first. shares_per_fragment is
+# DIGG_INITIAL_SUPPLY / supply, so a balance in shares divided by
+# DIGG_INITIAL_SUPPLY is its share of the total market cap.
+SUPPLY_RECORD_DTYPE = np.dtype(
+    [
+        ("epoch", "<u4"),
+        ("block", "<u8"),
+        ("timestamp", "<u8"),
+        ("supply", "<f8"),
+        ("shares_per_fragment", "<f8"),
+        ("tx", "u1", (32,)),
+    ]
+)
+REBASE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class SupplyTable:
+    def __init__(self, records: np.ndarray):
+        """
+        records: SUPPLY_RECORD_DTYPE array sorted by block, usually a read only view
+            over a memory mapped supply table file
+        """
+        self.records = records
+        self._tx_blocks = None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def tip_block(self) -> int:
+        return int(self.records["block"][-1]) if len(self.records) else 0
+
+    @property
+    def tip_timestamp(self) -> int:
+        return int(self.records["timestamp"][-1]) if len(self.records) else 0
+
+    def supply_at_timestamp(self, timestamp: str) -> Decimal:
+        i = np.searchsorted(self.records["timestamp"], int(timestamp), side="right")
+        if i == 0:
+            return Decimal(DIGG_INITIAL_SUPPLY)
+
+        return Decimal(repr(float(self.records["supply"][i - 1])))
+
+    def supply_at_block(self, blocks) -> np.ndarray:
+        """
+        Vectorized supply after the last rebase at or before each block.
+        """
+        return self._at_block(blocks, "supply", DIGG_INITIAL_SUPPLY)
+
+    def shares_per_fragment_at_block(self, blocks) -> np.ndarray:
+        return self._at_block(blocks, "shares_per_fragment", 1.0)
+
+    @property
+    def tip_supply(self) -> float:
+        if not len(self.records):
+            return DIGG_INITIAL_SUPPLY
+
+        return float(self.records["supply"][-1])
+
+    def block_of(self, tx: str) -> int:
+        """
+        Returns the block of the rebase in tx, or None if it isn't in the table. The
+        tx lookup is built from the records on first use.
+        """
+        if self._tx_blocks == None:
+            hashes = self.records["tx"].tobytes().hex()
+            self._tx_blocks = {
+                "0x" + hashes[i * 64 : (i + 1) * 64]: block_number
+                for i, block_number in enumerate(self.records["block"].tolist())
+            }
+
+        return self._tx_blocks.get(tx)
+
+    def supply_changes(self, start_block: int, end_block: int) -> dict:
+        """
+        Relative supply change of each rebase after start_block up to end_block.
+
+        return: dict(block: change)
+        """
+        blocks = self.records["block"]
+        start = np.searchsorted(blocks, start_block, side="right")
+        end = np.searchsorted(blocks, end_block, side="right")
+        supplies = self.records["supply"]
+        previous = np.concatenate([[DIGG_INITIAL_SUPPLY], supplies[:-1]])
+        changes = supplies[start:end] / previous[start:end] - 1
+
+        return dict(zip(blocks[start:end].tolist(), changes.tolist()))
+
+    def extend(self, rebases: list) -> "SupplyTable":
+        """
+        Returns a table with the rebases past tip_block appended in memory, the file
+        the table was loaded from is left as it is.
+
+        rebases: newest first, like DiggApi.rebases, only the ones with their
+            block_number are added
+        """
+        new_rebases = [
+            rebase
+            for rebase in reversed(rebases)
+            if rebase.get("block_number", 0) > self.tip_block
+        ]
+        if not new_rebases:
+            return self
+
+        records = np.zeros(len(new_rebases), dtype=SUPPLY_RECORD_DTYPE)
+        for i, rebase in enumerate(new_rebases):
+            records[i] = supply_record(
+                len(self.records) + i + 1, rebase, rebase["block_number"]
+            )
+
+        return SupplyTable(np.concatenate([self.records, records]))
+
+    def _at_block(self, blocks, field: str, initial: float) -> np.ndarray:
+        i = np.searchsorted(self.records["block"], blocks, side="right") - 1
+        values = self.records[field][np.maximum(i, 0)] if len(self.records) else 0.0
+
+        return np.where(i >= 0, values, initial)
+
+
+def load_supply_table(path: str = SUPPLY_TABLE_PATH) -> SupplyTable:
+    """
+    Memory maps the supply table at path read only. The pages are shared by every
+    process mapping the same file. Returns None if the table hasn't been synced.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[: len(SUPPLY_TABLE_MAGIC)] != SUPPLY_TABLE_MAGIC:
+        raise ValueError(f"{path} is not a supply table")
+
+    records = np.frombuffer(
+        buffer, dtype=SUPPLY_RECORD_DTYPE, offset=len(SUPPLY_TABLE_MAGIC)
+    )
+
+    return SupplyTable(records)
+
+
+def write_supply_table(path: str, records: np.ndarray):
+    """
+    Writes to a temporary file and renames it over path, so processes that already
+    mapped the old table keep a consistent view.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SUPPLY_TABLE_MAGIC)
+        f.write(np.sort(records, order="block").tobytes())
+    os.replace(tmp_path, path)
+
+
+def build_supply_records(api, table: SupplyTable = None) -> np.ndarray:
+    """
+    Builds supply records for every rebase listed by api.get_rebases. Blocks already
+    in table are reused, the rest are looked up by rebase timestamp.
+    """
+    rebases = list(reversed(api.get_rebases()))
+    records = np.zeros(len(rebases), dtype=SUPPLY_RECORD_DTYPE)
+    for i, rebase in enumerate(rebases):
+        block_number = None if table == None else table.block_of(rebase["tx"])
+        if block_number == None:
+            block_number = int(
+                api.eth.get_block_number_by_timestamp(
+                    timestamp=rebase_timestamp(rebase), closest="before"
+                )
+            )
+        records[i] = supply_record(i + 1, rebase, block_number)
+
+    return records
+
+
+def rebase_timestamp(rebase: dict) -> int:
+    return calendar.timegm(
+        datetime.strptime(rebase["time"], REBASE_TIME_FORMAT).utctimetuple()
+    )
+
+
+def supply_record(epoch: int, rebase: dict, block_number: int) -> tuple:
+    supply = float(rebase["supply"])
+
+    return (
+        epoch,
+        block_number,
+        rebase_timestamp(rebase),
+        supply,
+        DIGG_INITIAL_SUPPLY / supply,
+        np.frombuffer(bytes.fromhex(rebase["tx"][2:]), np.uint8),
+    )
+
+
+def sync_supply_table(api, path: str = SUPPLY_TABLE_PATH) -> SupplyTable:
+    records = build_supply_records(api, load_supply_table(path))
+    write_supply_table(path, records)
+    logger.info(f"Wrote {len(records)} rebases to {path}")
+
+    return load_supply_table(path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    from digg_api import DiggApi
+
+    sync_supply_table(DiggApi())
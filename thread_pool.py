@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from constants import THREAD_POOL_SIZE
+
+_local = threading.local()
+
+
+def _mark_worker():
+    _local.worker = True
+
+
+# one long lived pool, so the per thread sessions in the client registry and their
+# connections are reused across calls instead of dying with their threads
+_executor = ThreadPoolExecutor(
+    max_workers=THREAD_POOL_SIZE, thread_name_prefix="digg-it", initializer=_mark_worker
+)
+
+
+def map_threaded(fn, items, max_workers: int = THREAD_POOL_SIZE) -> list:
+    """
+    Calls fn on every item on the shared pool of threads and returns the results in
+    item order. Meant for the I/O bound lookups, which spend their time waiting on
+    the network rather than holding the GIL. A max_workers of 1 runs in the
+    caller's thread, as do calls made from a pool thread, which would otherwise
+    wait on a pool they're occupying.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1 or getattr(_local, "worker", False):
+        return [fn(item) for item in items]
+
+    return list(_executor.map(fn, items))
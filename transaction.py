@@ -3,10 +3,7 @@ from decimal import Decimal
 
 
 class Transaction:
-    def __init__(
-        self,
-        transaction: dict,
-    ):
+    def __init__(self, transaction: dict):
         """
         type: buy / sell
         block_number: number of ETH block tx occurred in
@@ -18,8 +15,10 @@ class Transaction:
         }
         raw_digg_amount: amount of DIGG token tx'd
         market_cap_pct: raw_digg_amount / totx_digg_supply -> percentage of digg supply tx'd
+        vault_transfer: leg of a bDIGG sett deposit or withdrawal
         """
         self.block_number = transaction.get("blockNumber")
+        self.tx_hash = transaction.get("hash")
         self.timestamp = transaction.get("timeStamp")
         self.from_address = transaction.get("from")
         self.to_address = transaction.get("to")
@@ -27,6 +26,7 @@ class Transaction:
         self.token_decimal = int(transaction.get("tokenDecimal", 0))
         self.token_amount = self.value / Decimal(math.pow(10, self.token_decimal))
         self.tx_type = transaction.get("type")
+        self.vault_transfer = transaction.get("vault_transfer", False)
 
         self.totx_digg_supply = transaction.get("totx_supply")
         self.totx_digg_price = transaction.get("totx_price")
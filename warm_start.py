@@ -0,0 +1,117 @@
+import base64
+from decimal import Decimal
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from checkpoint import MarketCapCheckpoint
+from constants import MARKET_CAP_CHECKPOINT_PATH, SUPPLY_TABLE_PATH, WARM_START_PATH
+from supply_table import SUPPLY_RECORD_DTYPE, load_supply_table, write_supply_table
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+WARM_START_VERSION = 1
+
+
+def export_warm_start(api, path: str = WARM_START_PATH):
+    """
+    Writes everything DiggApi derives from the network up to api.latest_block into
+    one gzipped json file:
+
+    {
+        "version": WARM_START_VERSION,
+        "tip_block": block the snapshot is current to,
+        "rebases": api.rebases,
+        "timestamps": {block: timestamp},
+        "prices": {block: digg price},
+        "market_cap": [[block, entry]] from the market cap checkpoint,
+        "supply_table": base64 supply table records,
+    }
+    """
+    supply_table = ""
+    if api.supply_table != None:
+        supply_table = base64.b64encode(api.supply_table.records.tobytes()).decode()
+
+    snapshot = {
+        "version": WARM_START_VERSION,
+        "tip_block": api.latest_block,
+        "created": int(time.time()),
+        "rebases": api.rebases,
+        "timestamps": api.timestamp_cache,
+        "prices": api.price_cache,
+        "market_cap": MarketCapCheckpoint(MARKET_CAP_CHECKPOINT_PATH).load(),
+        "supply_table": supply_table,
+    }
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt") as f:
+        json.dump(snapshot, f, default=str)
+    os.replace(tmp_path, path)
+
+    logger.info(
+        f"Exported warm start at block {api.latest_block} with "
+        f"{len(api.price_cache)} prices and {len(api.timestamp_cache)} timestamps"
+    )
+
+
+def load_warm_start(api, path: str = WARM_START_PATH) -> int:
+    """
+    Preloads api's caches and rebases from the snapshot at path, seeding the supply
+    table and market cap checkpoint if they don't exist yet. Returns the snapshot's
+    tip block, or None if there's no usable snapshot.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with gzip.open(path, "rt") as f:
+        snapshot = json.load(f)
+    if snapshot.get("version") != WARM_START_VERSION:
+        logger.warning(f"Ignoring warm start {path} with unknown version")
+        return None
+
+    api.rebases = snapshot["rebases"]
+    for block_number, timestamp in snapshot["timestamps"].items():
+        api.timestamp_cache[int(block_number)] = timestamp
+    for block_number, price in snapshot["prices"].items():
+        api.price_cache[int(block_number)] = {
+            field: None if value == None else Decimal(value)
+            for field, value in price.items()
+        }
+
+    if snapshot["supply_table"] and not os.path.exists(SUPPLY_TABLE_PATH):
+        records = np.frombuffer(
+            base64.b64decode(snapshot["supply_table"]), dtype=SUPPLY_RECORD_DTYPE
+        )
+        write_supply_table(SUPPLY_TABLE_PATH, records)
+        api.supply_table = load_supply_table()
+
+    if not os.path.exists(MARKET_CAP_CHECKPOINT_PATH):
+        MarketCapCheckpoint(MARKET_CAP_CHECKPOINT_PATH).extend(snapshot["market_cap"])
+
+    logger.info(f"Loaded warm start at block {snapshot['tip_block']}")
+
+    return snapshot["tip_block"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+    from constants import DIGG_START_BLOCK
+    from digg_api import DiggApi
+
+    # bring the market cap checkpoint up to the latest block before exporting it
+    api = DiggApi()
+    api.sync_rebases()
+    api.get_historic_market_cap_since_block(DIGG_START_BLOCK)
+
+    export_warm_start(api, sys.argv[1] if len(sys.argv) > 1 else WARM_START_PATH)
@@ -0,0 +1,175 @@
+import logging
+import sys
+import time
+
+from constants import (
+    DIGG_START_BLOCK,
+    ETH_BLOCKS_PER_DAY,
+    MARKET_CAP_CHECKPOINT_PATH,
+    TEST_ADDRESS,
+    WATCH_POLL_INTERVAL,
+)
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+logger = logging.getLogger("digg-it")
+logger.setLevel(logging.DEBUG)
+
+# the same twice a day grid as DiggApi.get_historic_market_cap_since_block
+MARKET_CAP_STRIDE = int(ETH_BLOCKS_PER_DAY / 2)
+
+from bdigg import BDiggShareIndex, get_addresses_exposure_txs
+from checkpoint import MarketCapCheckpoint
+from digg_api import DiggApi
+from position import Position, format_transaction
+from pricing import PricePlanner
+
+
+class PositionWatcher:
+    def __init__(
+        self,
+        api: DiggApi,
+        addresses: list,
+        checkpoint_path: str = MARKET_CAP_CHECKPOINT_PATH,
+    ):
+        """
+        Keeps the positions of addresses and the historic market cap current by
+        only processing blocks after last_block on every update.
+
+        last_block: last block whose transfers and rebases have been applied
+        next_market_cap_block: next block the historic market cap is sampled at
+        checkpoint: market cap checkpoint shared with
+            DiggApi.get_historic_market_cap_since_block, the history is resumed
+            from it and new samples are appended to it. None keeps them in memory.
+
+        Positions include bDIGG held, converted to digg at its share price.
+        """
+        self.api = api
+        self.positions = {}
+        self.market_cap = []
+        self.last_block = DIGG_START_BLOCK - 1
+        self.next_market_cap_block = DIGG_START_BLOCK
+        self.checkpoint = None
+        if checkpoint_path:
+            self.checkpoint = MarketCapCheckpoint(checkpoint_path)
+            self.market_cap, self.next_market_cap_block = self.checkpoint.resume(
+                DIGG_START_BLOCK, MARKET_CAP_STRIDE
+            )
+        self.bdigg_index = BDiggShareIndex(api)
+
+        for address in addresses:
+            self.positions[address] = Position(address)
+
+    def add_address(self, address: str) -> Position:
+        """
+        Starts watching address, catching its position up to last_block.
+        """
+        if address in self.positions:
+            return self.positions[address]
+
+        return self.add_position(
+            self.load_position(address, self.last_block), self.last_block
+        )
+
+    def load_position(self, address: str, to_block: int) -> Position:
+        """
+        Builds address's position from its transfers up to to_block without touching
+        the watched positions, so the crawl can run alongside update.
+        """
+        position = Position(address)
+        if to_block >= DIGG_START_BLOCK:
+            self._catch_up(position, DIGG_START_BLOCK, to_block)
+
+        return position
+
+    def add_position(self, position: Position, synced_block: int) -> Position:
+        """
+        Starts watching a position loaded up to synced_block, applying the blocks
+        the watcher has moved past since.
+        """
+        if position.address in self.positions:
+            return self.positions[position.address]
+
+        if self.last_block > synced_block:
+            self._catch_up(position, synced_block + 1, self.last_block)
+        self.positions[position.address] = position
+
+        return position
+
+    def remove_address(self, address: str):
+        self.positions.pop(address, None)
+
+    def update(self) -> bool:
+        """
+        Applies everything that happened since last_block. Returns False if there
+        were no new blocks.
+        """
+        latest_block = self.api.get_latest_block()
+        if latest_block <= self.last_block:
+            return False
+        self.api.latest_block = latest_block
+
+        self.api.sync_rebases()
+
+        market_cap_blocks = range(
+            self.next_market_cap_block, latest_block, MARKET_CAP_STRIDE
+        )
+
+        planner = PricePlanner(self.api)
+        planner.add_many(market_cap_blocks)
+        position_txs = get_addresses_exposure_txs(
+            self.api, self.bdigg_index, self.last_block + 1, list(self.positions)
+        )
+        for digg_txs in position_txs.values():
+            planner.add_many(tx["blockNumber"] for tx in digg_txs)
+        planner.fetch()
+
+        for address, digg_txs in position_txs.items():
+            self._apply_transfers(self.positions[address], digg_txs)
+        samples = [
+            (block_number, self.api.get_market_cap_sample(block_number))
+            for block_number in market_cap_blocks
+        ]
+        if self.checkpoint and samples:
+            self.checkpoint.extend(samples)
+        for block_number, entry in samples:
+            if entry:
+                self.market_cap.append(entry)
+            self.next_market_cap_block = block_number + MARKET_CAP_STRIDE
+
+        self.last_block = latest_block
+
+        return True
+
+    def run(self, poll_interval: int = WATCH_POLL_INTERVAL):
+        while True:
+            if self.update():
+                logger.info(f"Updated to block {self.last_block}")
+                market_cap = self.market_cap[-1] if self.market_cap else None
+                for position in self.positions.values():
+                    logger.info(position.summary(market_cap))
+            time.sleep(poll_interval)
+
+    def _catch_up(self, position: Position, from_block: int, to_block: int):
+        digg_txs = [
+            tx
+            for tx in get_addresses_exposure_txs(
+                self.api, self.bdigg_index, from_block, [position.address]
+            )[position.address]
+            if int(tx["blockNumber"]) <= to_block
+        ]
+        planner = PricePlanner(self.api)
+        planner.add_many(tx["blockNumber"] for tx in digg_txs)
+        planner.fetch()
+        self._apply_transfers(position, digg_txs)
+
+    def _apply_transfers(self, position: Position, digg_txs: list):
+        for tx in digg_txs:
+            position.apply(format_transaction(self.api, position.address, tx))
+
+
+if __name__ == "__main__":
+    addresses = sys.argv[1:] or [TEST_ADDRESS]
+
+    watcher = PositionWatcher(DiggApi(), addresses)
+    watcher.run()